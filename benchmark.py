@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+
+Benchmark the kernels, the time step of each engine and the input/output
+of the Cahn-Hilliard simulation, over grid sizes, engines and dtypes.
+The results are written as JSON, to track the performance across versions.
+
+Usage: python3 benchmark.py --sizes 64 128 256 --engines euler spectral
+       --dtypes float64 float32 --nstep 20 --output benchmark.json
+
+"""
+import Cahn_Hilliard
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import numpy as np
+
+def best_time(function, repeat=3, number=1):
+    """
+    This function measures the time of a call of 'function', as the best
+    of 'repeat' measures of 'number' consecutive calls, after a first call
+    that is not measured (compilation, caches, thread pools).
+
+    Parameters:
+    ----------
+    function : The function to be measured, called without arguments.
+
+    repeat : The number of measures (default is 3).
+
+    number : The number of calls of each measure (default is 1).
+
+    Returns:
+    -------
+    float
+        The time of a call in seconds.
+    """
+    function()
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+def benchmark_kernels(N, dtype, repeat=3):
+    """
+    This function measures the kernels of a time step on a N x N grid:
+    the reference and the in-place Laplacian and chemical potential.
+
+    Parameters:
+    ----------
+    N : The number of points of each side of the grid.
+
+    dtype : The floating point type of the grid.
+
+    repeat : The number of measures (default is 3).
+
+    Returns:
+    -------
+    list
+        A record for each kernel, with the time of a call and per cell.
+    """
+    np.random.seed(0)
+    c = Cahn_Hilliard.add_fluctuation(N, N, 0.5, 0.02, dtype=dtype)
+    out = np.empty_like(c)
+    work = np.empty_like(c)
+    kernels = {'my_laplacian': lambda: Cahn_Hilliard.my_laplacian(c, 1.0, 1.0),
+               'my_laplacian_inplace': lambda: Cahn_Hilliard.my_laplacian_inplace(c, 1.0, 1.0, out, work),
+               'chemical_potential': lambda: Cahn_Hilliard.chemical_potential(c, 1.0),
+               'chemical_potential_inplace': lambda: Cahn_Hilliard.chemical_potential_inplace(c, 1.0, out, work)}
+    records = []
+    for name, kernel in kernels.items():
+        seconds = best_time(kernel, repeat=repeat, number=10)
+        records.append({'benchmark': name, 'N': N, 'dtype': dtype,
+                        'seconds': seconds, 'seconds_per_cell': seconds / c.size})
+    return records
+
+def benchmark_step(N, dtype, engine, nstep=20, repeat=3, workers=None):
+    """
+    This function measures the time step of an engine on a N x N grid
+    with the parameters of the test configuration.
+
+    Parameters:
+    ----------
+    N : The number of points of each side of the grid.
+
+    dtype : The floating point type of the grid.
+
+    engine : The name of the engine, see 'Cahn_Hilliard.STEPPERS'.
+
+    nstep : The number of steps of each measure (default is 20).
+
+    repeat : The number of measures (default is 3).
+
+    workers : The number of threads or processes of the parallel engines.
+
+    Returns:
+    -------
+    dict
+        A record with the time of a step, the steps per second and the
+        time per cell update.
+    """
+    np.random.seed(0)
+    c = Cahn_Hilliard.add_fluctuation(N, N, 0.5, 0.02, dtype=dtype)
+    options = {'workers': workers} if engine in Cahn_Hilliard.PARALLEL_SOLVERS else {}
+    step = Cahn_Hilliard.STEPPERS[engine](c, 1.0, 0.5, 1.0, 1.0, 1.0, **options)
+    seconds = best_time(lambda: step(c, 0.01), repeat=repeat, number=nstep)
+    return {'benchmark': 'step', 'N': N, 'dtype': dtype, 'engine': engine,
+            'seconds': seconds, 'steps_per_second': 1 / seconds,
+            'seconds_per_cell_update': seconds / c.size}
+
+def benchmark_io(N, dtype, frames=10, repeat=3):
+    """
+    This function measures the writing and the reading of 'frames' results
+    on a N x N grid, in the CSV format ('save_results_csv' and
+    'load_results_from_csv'), in the binary format ('save_results_npy'
+    and 'load_results_npy') and in the compressed format with the default 
+    precision ('save_results_quantized' and 'open_results_quantized'), 
+    in a temporary folder. The results are evolved from random fluctuations, 
+    so that consecutive frames are correlated as in a simulation.
+
+    Parameters:
+    ----------
+    N : The number of points of each side of the grid.
+
+    dtype : The floating point type of the grid.
+
+    frames : The number of results written and read (default is 10).
+
+    repeat : The number of measures (default is 3).
+
+    Returns:
+    -------
+    list
+        A record for each operation, with the time, the size of the files,
+        the bytes written or read per second, the size of the frames in 
+        memory 'raw_bytes' and the compression ratio 'ratio' of the files.
+    """
+    np.random.seed(0)
+    c = Cahn_Hilliard.add_fluctuation(N, N, 0.5, 0.02, dtype=dtype)
+    results = Cahn_Hilliard.evolve_simulation(c, 10 * frames, 10, 0.01, 1.0, 0.5, 1.0, 1.0, 1.0)
+    raw_bytes = sum(c.nbytes + mu_c.nbytes for _, c, mu_c in results)
+    records = []
+    with tempfile.TemporaryDirectory() as folder:
+        csv_filename = os.path.join(folder, 'results.csv')
+        npy_folder = os.path.join(folder, 'results')
+        quantized_folder = os.path.join(folder, 'quantized')
+        operations = [('save_results_csv', lambda: Cahn_Hilliard.save_results_csv(results, csv_filename),
+                       lambda: os.path.getsize(csv_filename)),
+                      ('load_results_from_csv', lambda: Cahn_Hilliard.load_results_from_csv(N, N, csv_filename),
+                       lambda: os.path.getsize(csv_filename)),
+                      ('save_results_npy', lambda: Cahn_Hilliard.save_results_npy(results, npy_folder),
+                       lambda: folder_size(npy_folder)),
+                      ('load_results_npy', lambda: Cahn_Hilliard.load_results_npy(npy_folder),
+                       lambda: folder_size(npy_folder)),
+                      ('save_results_quantized', 
+                       lambda: Cahn_Hilliard.save_results_quantized(results, quantized_folder),
+                       lambda: folder_size(quantized_folder)),
+                      ('open_results_quantized', 
+                       lambda: list(Cahn_Hilliard.open_results_quantized(quantized_folder)),
+                       lambda: folder_size(quantized_folder))]
+        for name, operation, size in operations:
+            seconds = best_time(operation, repeat=repeat)
+            nbytes = size()
+            records.append({'benchmark': name, 'N': N, 'dtype': dtype, 'frames': frames,
+                            'seconds': seconds, 'bytes': nbytes, 'bytes_per_second': nbytes / seconds,
+                            'raw_bytes': raw_bytes, 'ratio': raw_bytes / nbytes})
+    return records
+
+def folder_size(folder):
+    """
+    This function computes the total size in bytes of the files in a folder.
+
+    Parameters:
+    ----------
+    folder : The folder.
+
+    Returns:
+    -------
+    int
+        The size of the folder.
+    """
+    return sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+
+def environment():
+    """
+    This function describes the environment of the benchmarks: the version
+    of the code (the git commit, if available), of Python and numpy, and the
+    number of CPUs.
+
+    Returns:
+    -------
+    dict
+        The description of the environment.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+def run_benchmarks(sizes, engines, dtypes, nstep=20, repeat=3, frames=10, workers=None):
+    """
+    This function runs all the benchmarks for each grid size and dtype,
+    and the time step benchmark for each engine. The 'numba' engine is 
+    skipped when numba is not installed, as it would only measure its 
+    fallback, the 'euler' engine.
+
+    Parameters:
+    ----------
+    sizes : The list of sides N of the N x N grids.
+
+    engines : The list of engines, see 'Cahn_Hilliard.STEPPERS'.
+
+    dtypes : The list of floating point types.
+
+    nstep : The number of steps of each measure of a time step (default is 20).
+
+    repeat : The number of measures (default is 3).
+
+    frames : The number of results of the input/output benchmarks (default is 10).
+
+    workers : The number of threads or processes of the parallel engines.
+
+    Returns:
+    -------
+    dict
+        The environment and the list of the records of the benchmarks.
+    """
+    if Cahn_Hilliard.numba is None and 'numba' in engines:
+        print('numba is not installed, the numba engine is skipped')
+        engines = [engine for engine in engines if engine != 'numba']
+    records = []
+    for N in sizes:
+        for dtype in dtypes:
+            records.extend(benchmark_kernels(N, dtype, repeat=repeat))
+            for engine in engines:
+                records.append(benchmark_step(N, dtype, engine, nstep=nstep,
+                                              repeat=repeat, workers=workers))
+            records.extend(benchmark_io(N, dtype, frames=frames, repeat=repeat))
+    return {'environment': environment(), 'records': records}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the Cahn-Hilliard simulation.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 128, 256],
+                        help='sides of the square grids')
+    parser.add_argument('--engines', nargs='+', default=sorted(Cahn_Hilliard.STEPPERS),
+                        choices=sorted(Cahn_Hilliard.STEPPERS), help='engines of the time step')
+    parser.add_argument('--dtypes', nargs='+', default=['float64', 'float32'],
+                        help='floating point types')
+    parser.add_argument('--nstep', type=int, default=20, help='steps of each measure')
+    parser.add_argument('--repeat', type=int, default=3, help='measures of each benchmark')
+    parser.add_argument('--frames', type=int, default=10, help='results written and read')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='threads or processes of the parallel engines (default is the number of CPUs)')
+    parser.add_argument('--output', default='benchmark.json', help='JSON file of the results')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.engines, args.dtypes, nstep=args.nstep,
+                            repeat=args.repeat, frames=args.frames, workers=args.workers)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    for record in report['records']:
+        print('{benchmark:>27} N={N:<5} {dtype:<8} {0:<10} {seconds:.3e} s'.format(
+            record.get('engine', ''), **record))
+    print("Benchmarks saved in {}".format(args.output))
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+
+Convert the results of a previous simulation from the CSV format 
+to the binary format of Cahn_Hilliard.save_results_npy.
+
+Usage: python3 convert_results.py name_of_configuration_file [csv_file]
+
+"""
+import Cahn_Hilliard
+import configparser
+import sys
+
+def convert_results():
+    """
+    Convert the CSV results of a simulation to the binary results folder 
+    given in the 'output' section of the configuration file, 
+    or to 'simulation_results' if the configuration does not use the 
+    binary format.
+
+    The grid size, 3D with 'Nz', and the floating point type 'dtype' 
+    are read from the 'settings' section of the configuration file, which is also stored in the metadata 
+    of the binary results. 
+    The CSV file is the second command line argument, 
+    'simulation_results.csv' if it is not given.
+
+    Returns:
+    -------
+    output_path : The folder of the binary results.
+    """
+    config = configparser.ConfigParser()
+    config.read(sys.argv[1])
+
+    Nx = int(config['settings']['Nx'])
+    Ny = int(config['settings']['Ny'])
+    # 3D grid and planar slices, see simulation.py
+    Nz = config.getint('settings', 'Nz', fallback=0) or None
+    slice_axis = config.get('output', 'slice_axis', fallback='none').strip().lower()
+    slice_axis = None if slice_axis in ('', 'none') else slice_axis
+    nslices = len(config.get('output', 'slice_index', fallback='0').split(','))
+    shape = Cahn_Hilliard.saved_frame_shape(Nx, Ny, Nz, slice_axis, nslices)
+    dtype = config.get('settings', 'dtype', fallback='float64')
+
+    csv_filename = sys.argv[2] if len(sys.argv) > 2 else 'simulation_results.csv'
+    if config.get('output', 'format', fallback='csv') == 'npy':
+        output_path = config['output']['path']
+    else:
+        output_path = 'simulation_results'
+
+    # Configuration stored with the results
+    parameters = {section: dict(config[section]) for section in config.sections()}
+    Cahn_Hilliard.convert_csv_to_npy(shape[-1], shape[-2], csv_filename=csv_filename, 
+                                     folder=output_path, config=parameters, 
+                                     Nz=shape[0] if len(shape) == 3 else None, dtype=dtype)
+    return output_path
+
+output_path = convert_results()
+print("Conversion done! Data saved in {}".format(output_path))
@@ -5,46 +5,187 @@ Created on Wed Oct  16 16:45:43 2024
 
 @author: decrinoa
 
+Usage: python3 plotting.py name_of_configuration_file [--headless] [--workers 4]
+       [--video simulation.gif]
+
 """
 import Cahn_Hilliard
+import argparse
+import concurrent.futures
 import configparser
+import multiprocessing
 import matplotlib.pyplot as plt
 import os
-import sys
+import numpy as np
+from matplotlib import animation
+from matplotlib.figure import Figure
+
+def plotted_plane(c, slice_axis=None):
+    """
+    This function selects the plane of a 3D frame that is plotted: 
+    the first saved slice if the frames are planar slices, 
+    otherwise the middle plane of constant z. 2D frames are returned as they are.
+
+    Parameters:
+    ----------
+    c : The frame, a 2D array or a 3D array of shape (Nz, Ny, Nx).
+
+    slice_axis : The axis of the saved slices, 'x', 'y' or 'z' 
+                 (default is None, full frames).
+
+    Returns:
+    -------
+    np.ndarray
+        A 2D array.
+    """
+    if c.ndim == 2:
+        return c
+    if slice_axis is None:
+        return c[c.shape[0] // 2]
+    return np.take(c, 0, axis=Cahn_Hilliard.SLICE_AXES[slice_axis])
+
+def open_results(output_format, output_path, shape, dtype='float64'):
+    """
+    This function opens the results of a simulation lazily,
+    see 'Cahn_Hilliard.open_results_npy', 'Cahn_Hilliard.open_results_quantized' 
+    and 'Cahn_Hilliard.open_results_csv'.
+
+    Parameters:
+    ----------
+    output_format : The format of the results, 'csv', 'npy' or 'quantized'.
+
+    output_path : The CSV file or the folder of the binary results.
+
+    shape : The shape of a saved frame, see 'Cahn_Hilliard.saved_frame_shape',
+            only used for CSV results.
+
+    dtype : The floating point type of the simulation, only used for CSV 
+            results (default is 'float64').
+
+    Returns:
+    -------
+    Cahn_Hilliard.LazyResults
+        The results, whose frames are read when they are used.
+    """
+    if output_format == 'npy':
+        return Cahn_Hilliard.open_results_npy(folder=output_path)
+    if output_format == 'quantized':
+        return Cahn_Hilliard.open_results_quantized(folder=output_path)
+    return Cahn_Hilliard.open_results_csv(shape[-1], shape[-2], filename=output_path,
+                                          Nz=shape[0] if len(shape) == 3 else None, dtype=dtype)
+
+def selected_frames(nframes, nsave):
+    """
+    This function selects the frames that are saved as images:
+    every 'nsave'-th saved frame, i.e. the frames number nsave, 2*nsave, ...
+    counting from 1.
+
+    Parameters:
+    ----------
+    nframes : The number of saved frames.
 
-config = configparser.ConfigParser()
-config.read(sys.argv[1])
+    nsave : The interval between two selected frames, in saved frames.
 
-Nx = config['settings']['Nx']
-Ny = config['settings']['Ny']
+    Returns:
+    -------
+    range
+        The indices of the selected frames.
+
+    Raise:
+    -----
+    ValueError if 'nsave' is less than 1.
+    """
+    if nsave < 1:
+        raise ValueError('nsave must be at least 1, but is {}'.format(nsave))
+    return range(nsave - 1, nframes, nsave)
+
+def frame_filename(folder, time):
+    """
+    This function returns the name of the image of the frame at 'time'.
+    """
+    return os.path.join(folder, f'plot_at_time_{time:.2f}.png')
+
+def build_figure(c, mu_c, figure=None):
+    """
+    This function builds the figure showing the concentration and the
+    chemical potential of a frame, with their colorbars. The figure is built
+    once and then updated in place by 'update_figure' for every frame.
+
+    Parameters:
+    ----------
+    c : The 2D concentration of the first frame.
+
+    mu_c : The 2D chemical potential of the first frame.
+
+    figure : The figure to draw on (default is None, a new figure
+             not managed by pyplot, which can be drawn without a display).
 
-nsave = config['settings']['nsave']
+    Returns:
+    -------
+    dict
+        The 'figure' and the images 'c' and 'mu_c'.
+    """
+    if figure is None:
+        figure = Figure(figsize=(12, 6))
+    axes_c = figure.add_subplot(1, 2, 1)
+    im_c = axes_c.imshow(c, cmap='gray', vmin=0, vmax=1)
+    figure.colorbar(im_c, ax=axes_c, label='c (a.u.)', aspect=40)
+
+    axes_m = figure.add_subplot(1, 2, 2)
+    im_m = axes_m.imshow(mu_c, cmap='plasma')
+    figure.colorbar(im_m, ax=axes_m, label='μ (x,y)', aspect=40)
+
+    figure.tight_layout()
+    return {'figure': figure, 'c': im_c, 'mu_c': im_m}
+
+def update_figure(artists, time, c, mu_c):
+    """
+    This function shows a new frame on a figure built by 'build_figure',
+    replacing the data of the images. The color scale of the chemical
+    potential follows the range of the frame.
 
-Nx = int(Nx)
-Ny = int(Ny)
+    Parameters:
+    ----------
+    artists : The dictionary returned by 'build_figure'.
+
+    time : The time of the frame.
+
+    c : The 2D concentration.
 
-nsave = int(nsave)
+    mu_c : The 2D chemical potential.
+
+    Returns:
+    -------
+    None
+    """
+    artists['c'].set_data(c)
+    artists['c'].axes.set_title(f'Concentration at time {time:.2f} s')
+    artists['mu_c'].set_data(mu_c)
+    artists['mu_c'].set_clim(np.min(mu_c), np.max(mu_c))
+    artists['mu_c'].axes.set_title(f'Chemical potential at time {time:.2f} s')
 
-def plot_results(results, nsave, folder='images'):
+def plot_results(results, nsave, folder='images', slice_axis=None):
     """
-    This function visualizes the concentration and chemical potential data from the 
-    simulation results. For each time step, it creates subplots displaying the concentration 
-    and chemical potential, and saves the plots as PNG files in the specified folder 
-    at defined intervals.
+    This function visualizes the concentration and chemical potential data from the
+    simulation results in a window, showing every frame in turn on the same
+    figure, and saves every 'nsave'-th frame as a PNG file in the specified folder.
 
     Parameters:
     ----------
-    results : A list where each tuple contains:
+    results : A list, or a Cahn_Hilliard.LazyResults, where each tuple contains:
         - time (float): The time point of the simulation.
         - c (numpy.ndarray): A 2D array representing the concentration at the given time.
         - mu_c (numpy.ndarray): A 2D array representing the chemical potential at the given time.
 
-    nsave : The interval at which to save the plots (in terms of time steps). 
-            Only plots for times that are multiples of this value will be saved.
+    nsave : The interval between two saved plots, in saved frames,
+            see 'selected_frames'.
 
-    folder : The directory where the plots will be saved (default is 'images'). 
+    folder : The directory where the plots will be saved (default is 'images').
              The directory will be created if it does not exist.
 
+    slice_axis : For 3D results, the axis of the saved planar slices
+                 (default is None), see 'plotted_plane'.
+
     Returns:
     -------
     None
@@ -52,29 +193,193 @@ def plot_results(results, nsave, folder='images'):
 
     """
     os.makedirs(folder, exist_ok=True)
-    
-    plt.figure(figsize=(12, 6))
-
-    for time, c, mu_c in results:
-        plt.subplot(1, 2, 1)
-        im_c = plt.imshow(c, cmap='gray', vmin=0, vmax=1)
-        plt.colorbar(im_c, label='c (a.u.)', aspect=40)
-        plt.title(f'Concentration at time {time:.2f} s')
-
-        plt.subplot(1, 2, 2)
-        im_m = plt.imshow(mu_c, cmap='plasma')
-        plt.colorbar(im_m, label='μ (x,y)', aspect=40)
-        plt.title(f'Chemical potential at time {time:.2f} s')
-    
-        plt.tight_layout()
-        
-        if time % nsave == 0:
-            plt.savefig(os.path.join(folder, f'plot_at_time_{time:.2f}.png'))
+    saved = set(selected_frames(len(results), nsave))
+    artists = None
+
+    for index, (time, c, mu_c) in enumerate(results):
+        c = plotted_plane(c, slice_axis)
+        mu_c = plotted_plane(mu_c, slice_axis)
+        if artists is None:
+            artists = build_figure(c, mu_c, plt.figure(figsize=(12, 6)))
+        update_figure(artists, time, c, mu_c)
+
+        if index in saved:
+            artists['figure'].savefig(frame_filename(folder, time))
             print(f'Saved plot for time {time:.2f} s')
-            
+
         plt.pause(0.1)
 
     plt.show()
-    
 
-plot_results(Cahn_Hilliard.load_results_from_csv(Nx, Ny, filename='simulation_results.csv'), nsave)
\ No newline at end of file
+def render_worker(source, indices, folder, slice_axis=None):
+    """
+    This function is run by each process of 'render_frames': it opens the
+    results, builds its own figure and saves the frames 'indices' as PNG files.
+
+    Parameters:
+    ----------
+    source : The arguments of 'open_results'.
+
+    indices : The indices of the frames to be rendered.
+
+    folder : The directory of the images.
+
+    slice_axis : See 'plotted_plane'.
+
+    Returns:
+    -------
+    list
+        The names of the written files.
+    """
+    results = open_results(*source)
+    artists = None
+    filenames = []
+    for index in indices:
+        time, c, mu_c = results[index]
+        c = plotted_plane(c, slice_axis)
+        mu_c = plotted_plane(mu_c, slice_axis)
+        if artists is None:
+            artists = build_figure(c, mu_c)
+        update_figure(artists, time, c, mu_c)
+        filenames.append(frame_filename(folder, time))
+        artists['figure'].savefig(filenames[-1])
+    return filenames
+
+def render_frames(source, nsave, folder='images', slice_axis=None, workers=None):
+    """
+    This function saves every 'nsave'-th frame of the results as a PNG file
+    without opening a window. The selected frames are divided in contiguous
+    groups rendered in parallel by a pool of processes, each one reading
+    only its frames and updating a single figure.
+
+    Parameters:
+    ----------
+    source : The arguments of 'open_results' for the results to be rendered.
+
+    nsave : The interval between two saved plots, in saved frames,
+            see 'selected_frames'.
+
+    folder : The directory where the plots will be saved (default is 'images').
+             The directory will be created if it does not exist.
+
+    slice_axis : See 'plotted_plane'.
+
+    workers : The number of processes (default is the number of CPUs).
+
+    Returns:
+    -------
+    list
+        The names of the written files, in the order of the frames.
+    """
+    os.makedirs(folder, exist_ok=True)
+    frames = selected_frames(len(open_results(*source)), nsave)
+    workers = min(workers or os.cpu_count() or 1, max(len(frames), 1))
+    groups = [group for group in np.array_split(np.asarray(frames, dtype=int), workers) if len(group)]
+    # Fresh processes from a forkserver: forking a process where the threads of the 
+    # numba kernels have been started can deadlock at exit, see 'process_stepper'
+    context = multiprocessing.get_context('forkserver')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        written = executor.map(render_worker, [source] * len(groups),
+                               [group.tolist() for group in groups],
+                               [folder] * len(groups), [slice_axis] * len(groups))
+        return [filename for filenames in written for filename in filenames]
+
+def write_animation(results, filename, nsave=1, slice_axis=None, fps=10):
+    """
+    This function writes every 'nsave'-th frame of the results to an
+    animation file, without opening a window. The format follows the
+    extension: '.gif' is written with Pillow, any other extension
+    (e.g. '.mp4') with ffmpeg.
+
+    Parameters:
+    ----------
+    results : A list, or a Cahn_Hilliard.LazyResults, of tuples (time, c, mu_c).
+
+    filename : The name of the animation file.
+
+    nsave : The interval between two frames of the animation, in saved frames
+            (default is 1, all the frames).
+
+    slice_axis : See 'plotted_plane'.
+
+    fps : The frames per second of the animation (default is 10).
+
+    Returns:
+    -------
+    None
+
+    Raise:
+    -----
+    ValueError if the format needs ffmpeg and it is not installed.
+    """
+    if filename.lower().endswith('.gif'):
+        writer = animation.PillowWriter(fps=fps)
+    elif animation.writers.is_available('ffmpeg'):
+        writer = animation.FFMpegWriter(fps=fps)
+    else:
+        raise ValueError('ffmpeg is needed to write {}, use a .gif file instead'.format(filename))
+    frames = selected_frames(len(results), nsave)
+    if not frames:
+        return
+    _, c, mu_c = results[frames[0]]
+    artists = build_figure(plotted_plane(c, slice_axis), plotted_plane(mu_c, slice_axis))
+    with writer.saving(artists['figure'], filename, dpi=artists['figure'].dpi):
+        for index in frames:
+            time, c, mu_c = results[index]
+            update_figure(artists, time, plotted_plane(c, slice_axis), plotted_plane(mu_c, slice_axis))
+            writer.grab_frame()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plot the results of the Cahn-Hilliard simulation.')
+    parser.add_argument('config', help='configuration file')
+    parser.add_argument('--headless', action='store_true',
+                        help='save the selected frames as PNG files without opening a window')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes rendering the frames with --headless (default is the number of CPUs)')
+    parser.add_argument('--video', default=None,
+                        help='write the selected frames to an animation file, .gif or .mp4 (with ffmpeg)')
+    parser.add_argument('--fps', type=int, default=10, help='frames per second of the animation')
+    parser.add_argument('--folder', default='images', help='directory of the PNG files')
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+
+    Nx = config['settings']['Nx']
+    Ny = config['settings']['Ny']
+    # Number of planes of a 3D grid, 2D grid if the key is missing
+    Nz = config.getint('settings', 'Nz', fallback=0) or None
+
+    # Interval between two saved plots, in saved frames
+    nsave = config['settings']['nsave']
+
+    Nx = int(Nx)
+    Ny = int(Ny)
+
+    nsave = int(nsave)
+
+    # Output format ('csv', 'npy' or 'quantized') and path, CSV file if the section is missing
+    output_format = config.get('output', 'format', fallback='csv')
+    output_path = config.get('output', 'path', fallback='simulation_results.csv')
+    # Planes of a 3D grid saved instead of the full grid
+    slice_axis = config.get('output', 'slice_axis', fallback='none').strip().lower()
+    slice_axis = None if slice_axis in ('', 'none') else slice_axis
+    slice_index = config.get('output', 'slice_index', fallback='0').split(',')
+
+    # With slices the frames have len(slice_index) points along slice_axis
+    shape = Cahn_Hilliard.saved_frame_shape(Nx, Ny, Nz, slice_axis, len(slice_index))
+    # Floating point type of the results, needed to read them back from CSV
+    dtype = config.get('settings', 'dtype', fallback='float64')
+    source = (output_format, output_path, shape, dtype)
+
+    if args.video is not None:
+        write_animation(open_results(*source), args.video, nsave=nsave,
+                        slice_axis=slice_axis, fps=args.fps)
+        print("Animation saved in {}".format(args.video))
+    elif args.headless:
+        filenames = render_frames(source, nsave, folder=args.folder,
+                                  slice_axis=slice_axis, workers=args.workers)
+        print("{} plots saved in {}".format(len(filenames), args.folder))
+    else:
+        # The frames are read one at a time while they are plotted
+        plot_results(open_results(*source), nsave, folder=args.folder, slice_axis=slice_axis)
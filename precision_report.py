@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+
+Compare simulations run in single (float32) and double (float64) precision:
+for each configuration the simulation is run twice by simulation.py with
+only the 'dtype' setting changed, and the drift of the float32 results from
+the float64 ones is reported, together with the mass conservation and the
+range of the concentration of both.
+
+Usage: python3 precision_report.py config_material_1.ini config_material_2.ini
+       --nstep 10000 --output precision_report.csv
+
+"""
+import Cahn_Hilliard
+import simulation
+import argparse
+import configparser
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+def run_with_dtype(config_file, dtype, folder, nstep=None):
+    """
+    This function runs the simulation of a configuration file with the
+    floating point type 'dtype', saving the results in binary format
+    to 'folder' and without checkpoints.
+
+    Parameters:
+    ----------
+    config_file : The configuration file.
+
+    dtype : The floating point type, 'float32' or 'float64'.
+
+    folder : The folder of the results.
+
+    nstep : The number of steps, if different from the configuration
+            (default is None).
+
+    Returns:
+    -------
+    tuple
+        The initial concentration and the results of the simulation,
+        as returned by 'Cahn_Hilliard.load_results_npy'.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    config.set('settings', 'dtype', dtype)
+    config.set('settings', 'nensemble', '1')
+    if nstep is not None:
+        config.set('settings', 'nstep', str(nstep))
+    if not config.has_section('output'):
+        config.add_section('output')
+    config.set('output', 'format', 'npy')
+    config.set('output', 'path', folder)
+    config.remove_option('output', 'checkpoint')
+    simulation.run_simulation(config)
+
+    # Same initial concentration as the one drawn by simulation.py
+    np.random.seed(config.getint('settings', 'seed'))
+    c_initial = Cahn_Hilliard.add_fluctuation(config.getint('settings', 'Nx'),
+                                              config.getint('settings', 'Ny'),
+                                              config.getfloat('material', 'c0'),
+                                              config.getfloat('material', 'dc'),
+                                              Nz=config.getint('settings', 'Nz', fallback=0) or None,
+                                              dtype=dtype)
+    return c_initial, Cahn_Hilliard.load_results_npy(folder)
+
+def compare_precision(config_file, nstep=None):
+    """
+    This function runs a configuration in float64 and float32 and compares
+    the results frame by frame. The mass is the mean concentration,
+    accumulated in double precision, and its drift is the difference with
+    the mean of the initial concentration, which the Cahn-Hilliard equation
+    conserves exactly.
+
+    Parameters:
+    ----------
+    config_file : The configuration file.
+
+    nstep : The number of steps, if different from the configuration
+            (default is None).
+
+    Returns:
+    -------
+    pandas.DataFrame
+        A row for each saved frame with the time, the largest and the root
+        mean square difference of the concentration, the mass drift and the
+        minimum and maximum of the concentration of both precisions.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        initial_64, results_64 = run_with_dtype(config_file, 'float64',
+                                                os.path.join(folder, 'float64'), nstep)
+        initial_32, results_32 = run_with_dtype(config_file, 'float32',
+                                                os.path.join(folder, 'float32'), nstep)
+    mass_64 = np.mean(initial_64, dtype=np.float64)
+    mass_32 = np.mean(initial_32, dtype=np.float64)
+    rows = []
+    for (time, c_64, _), (_, c_32, _) in zip(results_64, results_32):
+        difference = c_32.astype(np.float64) - c_64
+        rows.append({'config': os.path.basename(config_file), 'time': time,
+                     'max_abs_diff': np.max(np.abs(difference)),
+                     'rms_diff': np.sqrt(np.mean(difference**2)),
+                     'mass_drift_float64': np.mean(c_64, dtype=np.float64) - mass_64,
+                     'mass_drift_float32': np.mean(c_32, dtype=np.float64) - mass_32,
+                     'c_min_float64': np.min(c_64), 'c_max_float64': np.max(c_64),
+                     'c_min_float32': float(np.min(c_32)), 'c_max_float32': float(np.max(c_32))})
+    return pd.DataFrame(rows)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Drift of float32 simulations from float64.')
+    parser.add_argument('configs', nargs='*',
+                        default=['config_material_1.ini', 'config_material_2.ini', 'config_test.ini'],
+                        help='configuration files (default is the shipped 2D configurations)')
+    parser.add_argument('--nstep', type=int, default=None,
+                        help='number of steps of each run (default is the one of the configuration)')
+    parser.add_argument('--output', default='precision_report.csv', help='CSV file of the report')
+    args = parser.parse_args()
+
+    report = pd.concat([compare_precision(config_file, args.nstep) for config_file in args.configs],
+                       ignore_index=True)
+    report.to_csv(args.output, index=False)
+    # Summary at the last saved frame of each configuration
+    print(report.groupby('config').tail(1).to_string(index=False))
+    print("Report saved in {}".format(args.output))
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+
+Measure the speed-up of the parallel engines 'threads' and 'processes'
+of Cahn_Hilliard against the single-threaded 'euler' engine.
+
+Usage: python3 scaling_report.py --sizes 512 1024 2048 --workers 1 2 4 8
+       --engine threads --nstep 20 --output scaling_report.csv
+
+"""
+import Cahn_Hilliard
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+
+def time_engine(solver, N, nstep, workers=None, repeat=3):
+    """
+    This function measures the time per step of an engine on a N x N grid
+    with the parameters of the test configuration. The best of 'repeat'
+    runs of 'nstep' steps is kept, after a first step that prepares
+    the engine (thread pool, worker processes, compiled kernels).
+
+    Parameters:
+    ----------
+    solver : The name of the engine, see 'Cahn_Hilliard.STEPPERS'.
+
+    N : The number of points of each side of the grid.
+
+    nstep : The number of steps of each run.
+
+    workers : The number of threads or processes of the parallel engines.
+
+    repeat : The number of runs (default is 3).
+
+    Returns:
+    -------
+    float
+        The time of a step in seconds.
+    """
+    np.random.seed(0)
+    c = Cahn_Hilliard.add_fluctuation(N, N, 0.4, 0.01)
+    options = {'workers': workers} if solver in Cahn_Hilliard.PARALLEL_SOLVERS else {}
+    step = Cahn_Hilliard.STEPPERS[solver](c, 1.0, 0.5, 1.0, 1.0, 1.0, **options)
+    step(c, 0.01)
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(nstep):
+            step(c, 0.01)
+        best = min(best, (time.perf_counter() - start) / nstep)
+    return best
+
+def scaling_report(sizes, workers_list, nstep, engine='threads'):
+    """
+    This function builds the scaling report: for each grid size,
+    the time per step of the single-threaded 'euler' engine and, for each
+    number of workers, the time per step of the parallel engine
+    with its speed-up and parallel efficiency.
+
+    Parameters:
+    ----------
+    sizes : The list of sides N of the N x N grids.
+
+    workers_list : The list of numbers of threads or processes.
+
+    nstep : The number of steps of each run.
+
+    engine : The parallel engine, 'threads' or 'processes' (default is 'threads').
+
+    Returns:
+    -------
+    pandas.DataFrame
+        The report, with a row for each size and number of workers,
+        and the number of CPUs of the machine.
+    """
+    ncpu = os.cpu_count() or 1
+    rows = []
+    for N in sizes:
+        serial = time_engine('euler', N, nstep)
+        for workers in workers_list:
+            parallel = time_engine(engine, N, nstep, workers=workers)
+            rows.append({'N': N, 'cpus': ncpu, 'engine': engine, 'workers': workers, 'euler_step_s': serial,
+                         'engine_step_s': parallel, 'speedup': serial / parallel,
+                         'efficiency': serial / parallel / workers})
+            print('{0}x{0}, {1} {2}: speed-up {3:.2f}'.format(N, workers, engine, serial / parallel))
+    return pd.DataFrame(rows)
+
+if __name__ == '__main__':
+    ncpu = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description='Scaling report of the parallel engines.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[512, 1024, 2048],
+                        help='sides of the square grids')
+    parser.add_argument('--engine', default='threads', choices=['threads', 'processes'],
+                        help='parallel engine (default is threads)')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[n for n in (1, 2, 4, 8, 16, 32, 64) if n <= ncpu],
+                        help='numbers of threads or processes (default is powers of 2 up to the number of CPUs)')
+    parser.add_argument('--nstep', type=int, default=20, help='steps of each timed run')
+    parser.add_argument('--output', default='scaling_report.csv', help='CSV file of the report')
+    args = parser.parse_args()
+
+    report = scaling_report(args.sizes, args.workers, args.nstep, engine=args.engine)
+    report.to_csv(args.output, index=False)
+    print(report.to_string(index=False))
+    print("Report saved in {} ({} CPUs available)".format(args.output, ncpu))
@@ -8,41 +8,84 @@ Created on Wed Oct  16 16:45:43 2024
 """
 import Cahn_Hilliard
 import configparser
+import contextlib
+import os
 import sys
 import numpy as np
 
-def run_simulation():
+def run_simulation(config, restart=False, profiler=None):
     """
     Run the Cahn-Hilliard simulation based on parameters defined in a configuration file.
 
     This function initializes the simulation environment by loading parameters from 
     a configuration file (`configuration.ini`). It sets up the necessary simulation 
     parameters, initializes the concentration field, and evolves the simulation using 
-    the Cahn-Hilliard equation. The results are then saved to a CSV file.
+    the Cahn-Hilliard equation. The results are saved while they are produced 
+    to a CSV file or, if requested in the optional 'output' section, 
+    to the binary format of 'Cahn_Hilliard.save_results_npy', 
+    so that they are never all held in memory.
 
     Steps performed in this function:
-    1. Load simulation parameters from the configuration file.
-    2. Initialize the random seed for reproducibility.
-    3. Create the initial concentration field with fluctuations.
+    1. Load simulation parameters from the configuration file, 
+       including the time integration engine and the adaptive time stepping 
+       of the optional 'solver' section, and its 'boundary' condition 
+       ('periodic' or, for the 'multigrid' engine, 'neumann'). With 'Nz' and 'dz' in the 
+       'settings' section the grid is 3D.
+    2. Initialize the random seed for reproducibility. With 'nensemble' 
+       members, member i uses the seed 'seed + i'. The arrays have the 
+       floating point type 'dtype' of the 'settings' section (float64 
+       by default, float32 halves memory and bandwidth).
+    3. Create the initial concentration field with fluctuations or, 
+       with 'restart', read it from the last checkpoint together 
+       with the step reached.
     4. Evolve the simulation over a defined number of time steps.
-    5. Save the simulation results to a CSV file.
+    5. Save each result to a CSV file or to a binary results folder 
+       as soon as it is produced. For a 3D grid, only the planes 
+       'slice_index' normal to 'slice_axis' are saved if requested 
+       in the 'output' section. On restart the results written after 
+       the checkpoint are discarded and the new ones are appended. 
+       The files are written by a background thread fed by a queue of 
+       'queue' frames ('Cahn_Hilliard.AsyncWriter'), so that the steps 
+       only wait for the disk when the queue is full; 'queue = 0' in 
+       the 'output' section writes them in the time loop.
+    6. Save a checkpoint every 'ncheckpoint' steps, if requested 
+       in the 'output' section.
+    7. Compute the structure factor S(k, t) and the characteristic 
+       length L(t) every 'nanalysis' steps, if requested in the optional 
+       'analysis' section, and save these curves to its 'path'.
+    8. Stop the run before 'nstep' when one of the criteria of the 
+       optional 'convergence' section, checked every 'ncheck' steps, 
+       is met. The last result is the one of the step of the stop, 
+       and the reason and the step are stored in the metadata of the 
+       binary results.
+    9. With a 'path' in the optional 'out_of_core' section, keep the 
+       concentration in memory-mapped files instead, see 'run_out_of_core'.
+
+    Parameters:
+    ----------
+    config : The configparser.ConfigParser with the content 
+             of the configuration file.
+
+    restart : If True the run is continued from the last checkpoint 
+              (default is False).
+
+    profiler : A Cahn_Hilliard.Profiler recording the time of the phases 
+               of the evolution and of the output (default is None, 
+               no profiling).
 
     Returns:
     -------
-    None
-        The function does not return any value. It produces side effects by 
-        saving the simulation results to a file.
+    output_paths : The list of paths of the saved results, 
+                   one for each ensemble member.
     """
-    # Load data from configuration file
-    config = configparser.ConfigParser()
-    config.read(sys.argv[1])
-
-
     # Define the simulation cell parameters
     Nx = config['settings']['Nx']
     Ny = config['settings']['Ny']
     dx = config['settings']['dx']
     dy = config['settings']['dy']
+    # Number of planes and spacing of a 3D grid, 2D grid if the keys are missing
+    Nz = config.getint('settings', 'Nz', fallback=0) or None
+    dz = config.getfloat('settings', 'dz', fallback=1.0) if Nz else None
 
     # Time integration parameters
     nstep = config['settings']['nstep']
@@ -51,6 +94,10 @@ def run_simulation():
 
     # Random Seed
     seed = config['settings']['seed']
+    # Number of ensemble members, evolved together with seeds seed, seed+1, ...
+    nensemble = config.getint('settings', 'nensemble', fallback=1)
+    # Floating point precision of the arrays, double if the key is missing
+    dtype = config.get('settings', 'dtype', fallback='float64')
 
     # Material specific parameters
     c0 = config['material']['c0']
@@ -59,6 +106,46 @@ def run_simulation():
     grad_coef = config['material']['grad_coef']
     A = config['material']['A'] 
 
+    # Time integration engine, explicit Euler if the section is missing
+    solver = config.get('solver', 'engine', fallback='euler')
+    # Adaptive time stepping, fixed dtime if the keys are missing
+    adaptive = config.getboolean('solver', 'adaptive', fallback=False)
+    tolerance = config.getfloat('solver', 'tolerance', fallback=1e-4)
+    # Threads of the parallel engines, all the CPUs if the key is missing or 0
+    workers = config.getint('solver', 'workers', fallback=0) or None
+    # Boundary condition of the 'multigrid' engine, periodic if the key is missing
+    boundary = config.get('solver', 'boundary', fallback='periodic')
+
+    # Output format ('csv', 'npy' or 'quantized') and path, CSV file if the section is missing
+    output_format = config.get('output', 'format', fallback='csv')
+    output_path = config.get('output', 'path', fallback='simulation_results.csv')
+    # Largest error of the concentration stored in the 'quantized' format
+    precision = config.getfloat('output', 'precision', fallback=1e-4)
+    # Frames queued for the background writer, 0 writes them in the time loop
+    queue_depth = config.getint('output', 'queue', fallback=4)
+    # Checkpoint file and interval in steps, no checkpoints if the keys are missing
+    checkpoint_path = config.get('output', 'checkpoint', fallback=None)
+    ncheckpoint = config.getint('output', 'ncheckpoint', fallback=0)
+    # Planes of a 3D grid saved instead of the full grid, full grid if the keys are missing
+    slice_axis = config.get('output', 'slice_axis', fallback='none').strip().lower()
+    slice_axis = None if slice_axis in ('', 'none') else slice_axis
+    slice_index = [int(index) for index in config.get('output', 'slice_index', fallback='0').split(',')]
+    if slice_axis is not None and Nz is None:
+        raise ValueError('Planar slices require a 3D grid, with Nz in the settings section')
+    # Interval in steps and file of the in-situ structure factor, no analysis if the keys are missing
+    nanalysis = config.getint('analysis', 'nanalysis', fallback=0)
+    analysis_path = config.get('analysis', 'path', fallback='structure_factor.npz')
+    # Interval in steps and thresholds of the convergence criteria, no early stop if the keys are missing
+    ncheck = config.getint('convergence', 'ncheck', fallback=0)
+    thresholds = {name: config.getfloat('convergence', name, fallback=0.0) or None 
+                  for name in ('change', 'energy', 'length')}
+    # Folder and size limit in MB of the result cache, no cache if the keys are missing or empty
+    cache_path = config.get('cache', 'path', fallback='') or None
+    cache_size = config.getfloat('cache', 'max_size', fallback=1000.0)
+    # Folder of the memory-mapped concentration of an out-of-core run, in memory if the keys are missing or empty
+    out_of_core_path = config.get('out_of_core', 'path', fallback='') or None
+    tile_rows = config.getint('out_of_core', 'tile_rows', fallback=0) or None
+
     Nx = int(Nx)
     Ny = int(Ny)
     dx = float(dx)
@@ -75,19 +162,279 @@ def run_simulation():
     mobility = float(mobility)
     grad_coef = float(grad_coef)
     A = float(A)
-    
-    # Initialization of the random seed
-    np.random.seed(seed)
-    
-    # Creation of the empty 2Darray
-    c = np.zeros((Ny, Nx))
 
-    # Initial configuration with fluctuation
-    c = Cahn_Hilliard.add_fluctuation(Nx, Ny, c0, dc)
+    # Parameters that determine the evolution, nstep can change on restart
+    parameters = {'Nx': Nx, 'Ny': Ny, 'dx': dx, 'dy': dy, 
+                  'nprint': nprint, 'dtime': dtime, 'seed': seed, 
+                  'c0': c0, 'dc': dc, 'mobility': mobility, 
+                  'grad_coef': grad_coef, 'A': A, 'solver': solver, 
+                  'adaptive': adaptive, 'tolerance': tolerance, 
+                  'nensemble': nensemble}
+    if Nz is not None:
+        parameters.update({'Nz': Nz, 'dz': dz})
+    if np.dtype(dtype) != np.float64:
+        parameters['dtype'] = np.dtype(dtype).name
+    if boundary != 'periodic':
+        parameters['boundary'] = boundary
+    run_hash = Cahn_Hilliard.config_hash(parameters)
 
-    results = Cahn_Hilliard.evolve_simulation(c, nstep, nprint, dtime, mobility, grad_coef, A, dx, dy)
+    # Each ensemble member is saved to its own output, with the index appended to the name
+    if nensemble > 1:
+        root, extension = os.path.splitext(output_path)
+        output_paths = ['{}_{}{}'.format(root, i, extension) for i in range(nensemble)]
+    else:
+        output_paths = [output_path]
+
+    if out_of_core_path is not None:
+        if Nz is not None or nensemble > 1 or output_format != 'npy' or solver != 'euler' or adaptive:
+            raise ValueError('The out-of-core mode supports 2D runs of a single member '
+                             'with the euler engine, a fixed dtime and the npy format')
+        if nanalysis or ncheck:
+            raise ValueError('The analysis and the convergence criteria need the whole '
+                             'concentration in memory, they are not available out of core')
+        return run_out_of_core(out_of_core_path, (Ny, Nx), dtype, tile_rows, c0, dc, seed, 
+                               nstep, nprint, dtime, mobility, grad_coef, A, dx, dy, 
+                               output_path, checkpoint_path, ncheckpoint, run_hash, 
+                               {section: dict(config[section]) for section in config.sections()}, 
+                               restart, profiler)
+
+    # Runs already computed with the same parameters, output and version of the code
+    cache = None
+    cached = None
+    if cache_path is not None:
+        cache = Cahn_Hilliard.ResultCache(cache_path, max_bytes=cache_size * 1e6)
+        outputs = {'format': output_format, 'precision': precision if output_format == 'quantized' else None, 
+                   'slice_axis': slice_axis, 'slice_index': slice_index, 'nanalysis': nanalysis, 
+                   'ncheck': ncheck, 'thresholds': thresholds}
+        cache_key = Cahn_Hilliard.config_hash({'run': run_hash, 'outputs': outputs, 
+                                               'code': Cahn_Hilliard.source_hash([Cahn_Hilliard.__file__, 
+                                                                                  __file__])})
+        cache_paths = output_paths + ([analysis_path] if nanalysis else [])
+        cached = None if restart else cache.lookup(cache_key)
+        if cached is not None and (cached['nstep'] == nstep or 
+                                   cached['stop_step'] is not None and cached['stop_step'] <= nstep):
+            cache.restore(cache_key, cache_paths)
+            print('Results restored from the cache {}'.format(cache_path))
+            return output_paths
+    # A shorter run in the cache is continued up to nstep
+    resumed = cached is not None and cached['resumable'] and cached['nstep'] < nstep
+    
+    if restart or resumed:
+        if resumed:
+            cache.restore(cache_key, cache_paths)
+            state = Cahn_Hilliard.load_checkpoint(cached['state'])
+            print('Continuing the run of {} steps found in the cache {}'.format(cached['nstep'], cache_path))
+        elif checkpoint_path is None:
+            raise ValueError('No checkpoint file is given in the output section of the configuration')
+        else:
+            state = Cahn_Hilliard.load_checkpoint(checkpoint_path)
+        if state['config_hash'] != run_hash:
+            raise ValueError('The checkpoint {} belongs to a different configuration'.format(checkpoint_path))
+        np.random.set_state(state['rng_state'])
+        c = state['c']
+        start_step = state['istep']
+        start_dtime = state['dtime_next']
+        # Results written up to the checkpoint
+        resume = state['nframes']
+        resume_time = state['time']
+    else:
+        # Initialization of the random seed
+        np.random.seed(seed)
+        
+        # Creation of the empty 2Darray
+        c = np.zeros((Ny, Nx))
+
+        # Initial configuration with fluctuation
+        if nensemble > 1:
+            c = Cahn_Hilliard.add_fluctuation(Nx, Ny, c0, dc, 
+                                              seeds=[seed + i for i in range(nensemble)], 
+                                              Nz=Nz, dtype=dtype)
+        else:
+            c = Cahn_Hilliard.add_fluctuation(Nx, Ny, c0, dc, Nz=Nz, dtype=dtype)
+        start_step = 0
+        start_dtime = None
+        resume = None
+        resume_time = None
             
-    Cahn_Hilliard.save_results_csv(results, filename='simulation_results.csv')
+    if output_format == 'npy':
+        # Configuration stored with the results
+        parameters = {section: dict(config[section]) for section in config.sections()}
+        sinks = [Cahn_Hilliard.NpySink(folder=path, config=parameters, resume=resume, 
+                                       profiler=profiler) for path in output_paths]
+    elif output_format == 'quantized':
+        # The chemical potential is recomputed from the concentration when the results are read
+        parameters = {section: dict(config[section]) for section in config.sections()}
+        sinks = [Cahn_Hilliard.QuantizedSink(folder=path, precision=precision, A=A, 
+                                             config=parameters, resume=resume, profiler=profiler) 
+                 for path in output_paths]
+    else:
+        sinks = [Cahn_Hilliard.CsvSink(filename=path, resume=resume, profiler=profiler) 
+                 for path in output_paths]
+    # Disk writes overlapped with the computation of the following steps
+    if queue_depth:
+        sinks = [Cahn_Hilliard.AsyncWriter(sink, depth=queue_depth, profiler=profiler) for sink in sinks]
+
+    # Curves of the structure factor, averaged over the ensemble members
+    analysis = None
+    if nanalysis:
+        analysis = Cahn_Hilliard.StructureFactorAnalysis(dx, dy, dz, filename=analysis_path, 
+                                                         resume=resume_time)
+
+    # Criteria of the early stop
+    convergence = None
+    if ncheck:
+        convergence = Cahn_Hilliard.ConvergenceCriteria(A, grad_coef, dx, dy, dz, **thresholds)
+
+    def checkpoint(state):
+        # The results up to the checkpoint must be on disk before it is saved
+        for sink in sinks:
+            sink.flush()
+        if analysis is not None:
+            analysis.save()
+        Cahn_Hilliard.save_checkpoint(checkpoint_path, state['c'], state['istep'], state['time'], 
+                                      run_hash, len(sinks[0]), state['dtime_next'])
+
+    snapshots = Cahn_Hilliard.iterate_simulation(c, nstep, nprint, dtime, mobility, grad_coef, A, dx, dy,
+                                                 solver=solver, adaptive=adaptive, tolerance=tolerance,
+                                                 workers=workers, dz=dz,
+                                                 start_step=start_step, start_dtime=start_dtime,
+                                                 checkpoint=checkpoint if checkpoint_path and ncheckpoint else None,
+                                                 checkpoint_every=ncheckpoint or None,
+                                                 profiler=profiler, callback=analysis,
+                                                 callback_every=nanalysis or None,
+                                                 stop=convergence, stop_every=ncheck or None,
+                                                 boundary=boundary)
+
+    # Concentration evolved in place, the final state of the run
+    field = c
+    # Each snapshot is written as soon as it is produced
+    with contextlib.ExitStack() as stack:
+        for sink in sinks:
+            stack.enter_context(sink)
+        if analysis is not None:
+            stack.callback(analysis.save)
+        for time, c, mu_c in snapshots:
+            if slice_axis is not None:
+                c = Cahn_Hilliard.planar_slices(c, slice_axis, slice_index)
+                mu_c = Cahn_Hilliard.planar_slices(mu_c, slice_axis, slice_index)
+            members = zip(c, mu_c) if nensemble > 1 else [(c, mu_c)]
+            for sink, (c_member, mu_member) in zip(sinks, members):
+                sink.append(time, c_member, mu_member)
+        if convergence is not None and convergence.stop is not None:
+            print('Converged at step {step}, time {time:g}: {reason} rate {rate:.3g} '
+                  'below {threshold:g}'.format(**convergence.stop))
+            if output_format in ('npy', 'quantized'):
+                for sink in sinks:
+                    sink.record_stop(convergence.stop)
+    if queue_depth:
+        report = sinks[0].backpressure()
+        print('Background writer: queue depth {max_depth} of {depth} at most, {mean_depth:.2g} on average, '
+              'blocked {blocked_count} times for {blocked_seconds:.3g} s'.format(**report))
+    if output_format == 'quantized':
+        report = (sinks[0].sink if queue_depth else sinks[0]).report()
+        print('Compression ratio {:.1f} ({} frames, {:.3g} MB stored), encoded at {:.3g} MB/s'.format(
+            report['ratio'], report['frames'], report['stored_bytes'] / 1e6, 
+            report['bytes_per_second'] / 1e6))
+    # A longer run already in the cache is kept
+    if cache is not None and (cached is None or cached['nstep'] <= nstep):
+        stop_step = None if convergence is None or convergence.stop is None else convergence.stop['step']
+        # Adaptive runs are not continued, as the next time step is not kept
+        info = {'nstep': nstep, 'stop_step': stop_step, 
+                'resumable': not adaptive and stop_step is None and nstep % nprint == 0}
+        istep = nstep if stop_step is None else stop_step
+        cache.store(cache_key, cache_paths, field, istep, istep * dtime, run_hash, len(sinks[0]), info)
+
+    return output_paths
+
+def run_out_of_core(folder, shape, dtype, tile_rows, c0, dc, seed, nstep, nprint, dtime, 
+                    mobility, grad_coef, A, dx, dy, output_path, checkpoint_path, ncheckpoint, 
+                    run_hash, parameters, restart=False, profiler=None):
+    """
+    Run the simulation of 'run_simulation' with the concentration kept in 
+    memory-mapped files in 'folder' ('Cahn_Hilliard.MappedField'), 
+    for grids that do not fit in memory. The initial concentration is drawn 
+    tile by tile, the results are written to the binary format directly 
+    from the mapped files, and the checkpoints are copies of the file 
+    of the concentration made by the operating system. 
+    The results are the same as the ones of the 'euler' engine in memory.
+
+    Parameters:
+    ----------
+    folder : The folder of the memory-mapped files.
+
+    shape : The shape (Ny, Nx) of the grid.
+
+    dtype : The floating point type of the concentration.
+
+    tile_rows : The number of rows of a tile, None for the default size.
+
+    c0, dc, seed : The initial concentration, its fluctuation and the random seed.
+
+    nstep, nprint, dtime, mobility, grad_coef, A, dx, dy : As in 'run_simulation'.
+
+    output_path : The folder of the binary results.
+
+    checkpoint_path : The checkpoint file, None for no checkpoints.
+
+    ncheckpoint : The interval in steps of the checkpoints, 0 for none.
+
+    run_hash : The hash of the parameters stored with the checkpoints.
+
+    parameters : The configuration stored with the results.
+
+    restart : If True the run is continued from the last checkpoint 
+              (default is False).
+
+    profiler : A Cahn_Hilliard.Profiler (default is None, no profiling).
+
+    Returns:
+    -------
+    output_paths : The list with the path of the results.
+    """
+    field = Cahn_Hilliard.MappedField(folder, shape, dtype=dtype, tile_rows=tile_rows)
+    if restart:
+        if checkpoint_path is None:
+            raise ValueError('No checkpoint file is given in the output section of the configuration')
+        state = Cahn_Hilliard.load_mapped_checkpoint(checkpoint_path)
+        if state['config_hash'] != run_hash:
+            raise ValueError('The checkpoint {} belongs to a different configuration'.format(checkpoint_path))
+        field.load(checkpoint_path)
+        start_step = state['istep']
+        resume = state['nframes']
+    else:
+        # Same initial concentration as 'Cahn_Hilliard.add_fluctuation' with this seed
+        np.random.seed(seed)
+        field.fill_fluctuation(c0, dc)
+        start_step = 0
+        resume = None
+
+    with Cahn_Hilliard.NpySink(folder=output_path, config=parameters, resume=resume, 
+                               profiler=profiler) as sink:
+        def checkpoint(state):
+            # The results up to the checkpoint must be on disk before it is saved
+            sink.flush()
+            field.checkpoint(checkpoint_path, state['istep'], state['time'], run_hash, len(sink))
+
+        snapshots = Cahn_Hilliard.iterate_out_of_core(field, nstep, nprint, dtime, mobility, grad_coef, 
+                                                      A, dx, dy, start_step=start_step, 
+                                                      checkpoint=checkpoint if checkpoint_path and ncheckpoint else None,
+                                                      checkpoint_every=ncheckpoint or None, 
+                                                      profiler=profiler)
+        # The mapped arrays are copied to the results before the next step
+        for time, c, mu_c in snapshots:
+            sink.append(time, c, mu_c)
+    return [output_path]
+
+if __name__ == '__main__':
+    # Load data from configuration file
+    config = configparser.ConfigParser()
+    config.read(sys.argv[1])
+
+    # Time of the phases of the run, printed at the end
+    profiler = Cahn_Hilliard.Profiler() if '--profile' in sys.argv[2:] else None
 
-run_simulation()
-print("Simulation done! Data saved in simulation_results.csv")    
\ No newline at end of file
+    # Continue the run from the last checkpoint
+    output_paths = run_simulation(config, restart='--restart' in sys.argv[2:], profiler=profiler)
+    print("Simulation done! Data saved in {}".format(', '.join(output_paths)))
+    if profiler is not None:
+        print(profiler.summary())    
\ No newline at end of file
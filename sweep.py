@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+
+Run a parameter sweep of the Cahn-Hilliard simulation on a pool of processes.
+
+Usage: python3 sweep.py name_of_configuration_file --param A=0.5,1.0
+       --param grad_coef=0.5:1.5:3 --workers 4 --folder sweep_results
+
+"""
+import Cahn_Hilliard
+import simulation
+import argparse
+import concurrent.futures
+import configparser
+import itertools
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+
+# Options of the output section set by 'prepare_job' in the folder of each job
+JOB_OUTPUT = (('output', 'format'), ('output', 'path'), ('output', 'checkpoint'), 
+              ('analysis', 'path'))
+
+def parse_values(text):
+    """
+    This function parses the values taken by a parameter in the sweep.
+    The values are either a comma separated list, e.g. '0.5,1.0,2.0',
+    or a range 'start:stop:num' of 'num' evenly spaced values
+    between 'start' and 'stop' included, e.g. '0.5:1.5:3'.
+
+    Parameters:
+    ----------
+    text : The values of the parameter.
+
+    Returns:
+    -------
+    list
+        The values as strings, as they are written in the configuration file.
+
+    Raise:
+    -----
+    ValueError if a range has not three fields or less than one value.
+    """
+    if ':' not in text:
+        return [value.strip() for value in text.split(',')]
+    fields = text.split(':')
+    if len(fields) != 3 or int(fields[2]) < 1:
+        raise ValueError('A range must be start:stop:num with num >= 1, but is {}'.format(text))
+    return [repr(float(value)) for value in np.linspace(float(fields[0]), float(fields[1]),
+                                                        int(fields[2]))]
+
+def parameter_grid(config, params):
+    """
+    This function builds the list of parameter combinations of the sweep,
+    i.e. the cartesian product of the values of each parameter.
+
+    Parameters:
+    ----------
+    config : The configparser.ConfigParser of the base configuration.
+
+    params : A list of strings 'name=values', where 'name' is either
+             'section.key' or a key of the 'material' or 'settings' section,
+             and 'values' is parsed by 'parse_values'.
+
+    Returns:
+    -------
+    list
+        A list of dictionaries {(section, key): value}, one for each job.
+
+    Raise:
+    -----
+    ValueError if a parameter is not found in the base configuration.
+    """
+    names = []
+    values = []
+    for param in params:
+        name, text = param.split('=', 1)
+        if '.' in name:
+            section, key = name.split('.', 1)
+        else:
+            key = name
+            section = next((section for section in ('material', 'settings')
+                            if config.has_option(section, key)), None)
+        if section is None or not config.has_option(section, key):
+            raise ValueError('The parameter {} is not in the base configuration'.format(name))
+        names.append((section, key.lower()))
+        values.append(parse_values(text))
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+def job_name(config, overrides):
+    """
+    This function names the folder of a job after a hash of its parameters:
+    the base configuration with the parameters of the job, except the output
+    paths set by 'prepare_job'. A job keeps its folder when the sweep is
+    restarted, even if other values are added to the sweep, and gets a new
+    folder if the base configuration has changed.
+
+    Parameters:
+    ----------
+    config : The base configuration (configparser.ConfigParser).
+
+    overrides : The dictionary {(section, key): value} of the job.
+
+    Returns:
+    -------
+    str
+        The name of the job.
+    """
+    parameters = {'{}.{}'.format(section, key): value.strip()
+                  for section in config.sections() for key, value in config.items(section)
+                  if (section, key) not in JOB_OUTPUT}
+    parameters.update({'{}.{}'.format(section, key): value for (section, key), value in overrides.items()})
+    return 'job_' + Cahn_Hilliard.config_hash(parameters)[:12]
+
+def prepare_job(config_file, overrides, folder):
+    """
+    This function writes the configuration file of a job in its folder:
+    the base configuration with the parameters of the job,
+    and the results, the checkpoint and the analysis saved inside the job folder.
+
+    Parameters:
+    ----------
+    config_file : The base configuration file.
+
+    overrides : The dictionary {(section, key): value} of the job.
+
+    folder : The folder of the job, created if it does not exist.
+
+    Returns:
+    -------
+    None
+    """
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    for (section, key), value in overrides.items():
+        config.set(section, key, value)
+    if not config.has_section('output'):
+        config.add_section('output')
+    config.set('output', 'format', 'npy')
+    config.set('output', 'path', os.path.join(folder, 'simulation_results'))
+    config.set('output', 'checkpoint', os.path.join(folder, 'checkpoint.npz'))
+    if config.has_section('analysis'):
+        config.set('analysis', 'path', os.path.join(folder, 'structure_factor.npz'))
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, 'config.ini'), 'w') as file:
+        config.write(file)
+
+def read_status(folder):
+    """
+    This function reads the status of a job written by 'run_job'.
+
+    Parameters:
+    ----------
+    folder : The folder of the job.
+
+    Returns:
+    -------
+    dict
+        The status of the job, with the keys 'status' ('done', 'failed' or
+        'pending' if the job has not been run), 'error' and 'elapsed'.
+    """
+    filename = os.path.join(folder, 'status.json')
+    if not os.path.exists(filename):
+        return {'status': 'pending', 'error': '', 'elapsed': None}
+    with open(filename) as file:
+        return json.load(file)
+
+def run_job(folder):
+    """
+    This function runs the simulation of a job in a worker process,
+    as simulation.py does with the configuration file of the job,
+    and writes its status to 'status.json' in the job folder.
+    Any error of the simulation is recorded in the status instead of
+    being raised, so that a failed job does not stop the sweep.
+
+    Parameters:
+    ----------
+    folder : The folder of the job.
+
+    Returns:
+    -------
+    dict
+        The status of the job, see 'read_status'.
+    """
+    config = configparser.ConfigParser()
+    config.read(os.path.join(folder, 'config.ini'))
+    start = time.perf_counter()
+    try:
+        simulation.run_simulation(config)
+        status = {'status': 'done', 'error': ''}
+    except Exception as error:
+        status = {'status': 'failed', 'error': repr(error)}
+    status['elapsed'] = time.perf_counter() - start
+    with open(os.path.join(folder, 'status.json'), 'w') as file:
+        json.dump(status, file)
+    return status
+
+def write_index(jobs, folder):
+    """
+    This function writes the summary index of the sweep to 'index.csv'
+    in the sweep folder: a row for each job with its name, its parameters,
+    its status and the path of its results.
+
+    Parameters:
+    ----------
+    jobs : A dictionary {name: overrides} of the jobs of the sweep.
+
+    folder : The folder of the sweep.
+
+    Returns:
+    -------
+    pandas.DataFrame
+        The content of the index.
+    """
+    rows = []
+    for name, overrides in jobs.items():
+        row = {'job': name}
+        row.update({'{}.{}'.format(section, key): value
+                    for (section, key), value in overrides.items()})
+        row.update(read_status(os.path.join(folder, name)))
+        row['results'] = os.path.join(folder, name, 'simulation_results')
+        rows.append(row)
+    index = pd.DataFrame(rows)
+    index.to_csv(os.path.join(folder, 'index.csv'), index=False)
+    return index
+
+def run_sweep(config_file, params, folder='sweep_results', workers=None):
+    """
+    This function runs a simulation for each combination of parameters
+    of 'parameter_grid' on a pool of 'workers' processes. Each job writes
+    its configuration, results, checkpoint and status to its own folder
+    inside 'folder', and the summary index is updated after each job.
+    The jobs already done or failed in a previous run of the same sweep
+    are skipped.
+
+    Parameters:
+    ----------
+    config_file : The base configuration file.
+
+    params : A list of strings 'name=values', see 'parameter_grid'.
+
+    folder : The folder of the sweep (default is 'sweep_results').
+
+    workers : The number of worker processes (default is the number of CPUs).
+
+    Returns:
+    -------
+    pandas.DataFrame
+        The summary index of the sweep.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    jobs = {job_name(config, overrides): overrides for overrides in parameter_grid(config, params)}
+    pending = []
+    for name, overrides in jobs.items():
+        job_folder = os.path.join(folder, name)
+        if read_status(job_folder)['status'] == 'pending':
+            prepare_job(config_file, overrides, job_folder)
+            pending.append(job_folder)
+    write_index(jobs, folder)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_job, job_folder): job_folder for job_folder in pending}
+        for future in concurrent.futures.as_completed(futures):
+            print('{}: {}'.format(os.path.basename(futures[future]), future.result()['status']))
+            write_index(jobs, folder)
+
+    return write_index(jobs, folder)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parameter sweep of the Cahn-Hilliard simulation.')
+    parser.add_argument('config', help='base configuration file')
+    parser.add_argument('--param', action='append', default=[],
+                        help="parameter values, e.g. A=0.5,1.0 or grad_coef=0.5:1.5:3")
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default is the number of CPUs)')
+    parser.add_argument('--folder', default='sweep_results', help='output folder of the sweep')
+    args = parser.parse_args()
+
+    index = run_sweep(args.config, args.param, folder=args.folder, workers=args.workers)
+    print("Sweep done! {} jobs done, {} failed, index saved in {}".format(
+        (index['status'] == 'done').sum(), (index['status'] == 'failed').sum(),
+        os.path.join(args.folder, 'index.csv')))
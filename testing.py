@@ -459,6 +459,95 @@ def test_my_laplacian_shape(Nx, Ny, dx, dy):
     
     assert result.shape == c.shape    
 
+#############################my_laplacian_inplace#############################
+
+@given(Nx=st.integers(1,Nx), Ny=st.integers(1,Ny), 
+       dx=st.floats(0.1,dx), dy=st.floats(0.1,dy))
+def test_my_laplacian_inplace_matches_reference(Nx, Ny, dx, dy):
+    """
+    This test verifies that 'my_laplacian_inplace' gives the same values 
+    as the reference 'my_laplacian', including the degenerate matrices 
+    with a single row or column where the periodic neighbours coincide.
+
+    Parameters:
+    ----------
+    Nx : The number of columns in the concentration matrix. 
+         Must be >= 1 than and <= than Nx in configuration file.
+       
+    Ny : The number of rows in the concentration matrix. 
+         Must be >= than 1 and <= than Ny in configuration file.
+         
+    dx : The spacing between points in the x-direction. 
+         Must be >= than 0.1 and <= than dx in configuration file.
+    
+    dy : The spacing between points in the y-direction. 
+         Must be >= than 0.1 and <= than dy in configuration file.
+
+    Assertions:
+    -----------
+    - Asserts that the in-place Laplacian is close to the reference one.
+    """
+    c = np.random.rand(Ny, Nx)
+    expected = Cahn_Hilliard.my_laplacian(c, dx, dy)
+    result = Cahn_Hilliard.my_laplacian_inplace(c, dx, dy)
+    
+    assert np.allclose(result, expected)
+
+def test_my_laplacian_inplace_buffers():
+    """
+    This test verifies that 'my_laplacian_inplace' writes the result 
+    in the given output buffer, leaves the input untouched and refuses 
+    an output buffer that overlaps with the input.
+
+    Parameters:
+    ----------
+    None
+
+    Assertions:
+    -----------
+    - Asserts that the returned array is the output buffer.
+    - Asserts that the input concentration is not modified.
+    - Asserts that a ValueError is raised when 'out' is the input itself.
+    """
+    c = np.random.rand(8, 6)
+    c_copy = np.copy(c)
+    out = np.empty_like(c)
+    work = np.empty_like(c)
+    result = Cahn_Hilliard.my_laplacian_inplace(c, dx, dy, out=out, work=work)
+    
+    assert result is out
+    assert np.array_equal(c, c_copy)
+    
+    try:
+        Cahn_Hilliard.my_laplacian_inplace(c, dx, dy, out=c, work=work)
+        raised = False
+    except ValueError:
+        raised = True
+    
+    assert raised
+
+##########################chemical_potential_inplace##########################
+
+def test_chemical_potential_inplace_matches_reference():
+    """
+    This test verifies that 'chemical_potential_inplace' gives the same 
+    values as 'chemical_potential' on a random concentration matrix.
+
+    Parameters:
+    ----------
+    None
+
+    Assertions:
+    -----------
+    - Asserts that the in-place chemical potential is close 
+      to the reference one.
+    """
+    c = np.random.rand(Ny, Nx)
+    expected = Cahn_Hilliard.chemical_potential(c, A)
+    result = Cahn_Hilliard.chemical_potential_inplace(c, A)
+    
+    assert np.allclose(result, expected)
+
 ###############################evolve_simulation###############################    
     
 def test_evolve_simulation_basic_function():
@@ -590,6 +679,257 @@ def test_evolve_simulation_grad_coef():
     # Check that the final concentrations are sufficiently different
     assert not np.allclose(final_concentration_low, final_concentration_high)
 
+
+def test_evolve_simulation_no_allocation_per_step():
+    """
+    This test verifies that the time steps of 'evolve_simulation' do not 
+    allocate new arrays: without stored results, the peak of the memory 
+    traced during the whole run must stay below the few buffers 
+    allocated before the loop, whatever the number of steps.
+    The grid is large enough that the fixed-size internal buffers used by 
+    numpy for strided operations are negligible.
+
+    Parameters:
+    ----------
+    None
+
+    Assertions:
+    -----------
+    - Asserts that the peak memory is lower than five concentration arrays.
+    """
+    import tracemalloc
+    
+    c = Cahn_Hilliard.add_fluctuation(400, 400, c0, dc)
+    tracemalloc.start()
+    Cahn_Hilliard.evolve_simulation(c, 50, 100, dtime, 
+                                    mobility, grad_coef, A, dx, dy)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    assert peak < 5 * c.nbytes
+
+def test_evolve_simulation_unknown_solver():
+    """
+    This test verifies that 'evolve_simulation' refuses an unknown 
+    time integration engine.
+
+    Parameters:
+    ----------
+    None
+
+    Assertions:
+    -----------
+    - Asserts that a ValueError is raised for an unknown solver name.
+    """
+    c = Cahn_Hilliard.add_fluctuation(10, 10, c0, dc)
+    try:
+        Cahn_Hilliard.evolve_simulation(c, 10, 5, dtime, mobility, 
+                                        grad_coef, A, dx, dy, solver='unknown')
+        raised = False
+    except ValueError:
+        raised = True
+    
+    assert raised
+
+##############################spectral_stepper##############################
+
+def test_laplacian_symbol_matches_my_laplacian():
+    """
+    This test verifies that multiplying the Fourier transform of a matrix 
+    by 'laplacian_symbol' gives the same result as 'my_laplacian', 
+    also for different spacings in the two directions.
+
+    Parameters:
+    ----------
+    None
+
+    Assertions:
+    -----------
+    - Asserts that the spectral Laplacian is close to the finite-difference one.
+    """
+    c = np.random.rand(12, 9)
+    symbol = Cahn_Hilliard.laplacian_symbol(c.shape, 1.0, 1.5)
+    result = np.fft.irfft2(np.fft.rfft2(c) * symbol, s=c.shape)
+    
+    assert np.allclose(result, Cahn_Hilliard.my_laplacian(c, 1.0, 1.5))
+
+def test_spectral_solver_matches_euler():
+    """
+    This test verifies that for a small time step the semi-implicit 
+    spectral engine gives the same evolution as the explicit Euler one 
+    and returns results with the same structure.
+
+    Parameters:
+    ----------
+    None
+
+    Assertions:
+    -----------
+    - Asserts that the two engines return the same number of results 
+      at the same times.
+    - Asserts that the final concentrations differ by less than 1e-3.
+    """
+    c_initial = Cahn_Hilliard.add_fluctuation(16, 16, c0, dc)
+    results_euler = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 500, 100, 
+                                                    dtime, mobility, grad_coef, 
+                                                    A, dx, dy)
+    results_spectral = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 500, 100, 
+                                                       dtime, mobility, grad_coef, 
+                                                       A, dx, dy, solver='spectral')
+    
+    assert [r[0] for r in results_euler] == [r[0] for r in results_spectral]
+    assert np.allclose(results_euler[-1][1], results_spectral[-1][1], atol=1e-3)
+
+def test_spectral_solver_large_time_step():
+    """
+    This test verifies that the spectral engine remains stable and conserves 
+    the total concentration with a time step 100 times larger than the one 
+    of the configuration file, for which the explicit Euler engine diverges.
+
+    Parameters:
+    ----------
+    None
+
+    Assertions:
+    -----------
+    - Asserts that the concentration stays finite and within [-0.5, 1.5].
+    - Asserts that the mean concentration is conserved.
+    """
+    c_initial = Cahn_Hilliard.add_fluctuation(32, 32, c0, dc)
+    results = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 50, 10, 
+                                              100 * dtime, mobility, grad_coef, 
+                                              A, dx, dy, solver='spectral')
+    final_concentration = results[-1][1]
+    
+    assert np.all(np.isfinite(final_concentration))
+    assert np.all(final_concentration > -0.5) and np.all(final_concentration < 1.5)
+    assert np.isclose(final_concentration.mean(), c_initial.mean())
+
+def test_spectral_solver_bounded_cache():
+    """
+    This test advances the spectral engine with many different time steps, 
+    as an adaptive run does, and verifies that the cached denominators 
+    do not accumulate while the results do not change.
+
+    Parameters:
+    ----------
+    None
+
+    Assertions:
+    -----------
+    - Asserts that at most two denominators are cached.
+    - Asserts that a step after the cache eviction equals a step of a new engine.
+    """
+    c = Cahn_Hilliard.add_fluctuation(16, 16, c0, dc)
+    step = Cahn_Hilliard.spectral_stepper(c, mobility, grad_coef, A, dx, dy)
+    for i in range(1, 20):
+        step(c, dtime * i)
+    denominators = step.__closure__[step.__code__.co_freevars.index('denominators')].cell_contents
+    
+    assert len(denominators) <= 2
+    
+    c_fresh = c.copy()
+    step(c, dtime)
+    Cahn_Hilliard.spectral_stepper(c_fresh, mobility, grad_coef, A, dx, dy)(c_fresh, dtime)
+    
+    assert np.array_equal(c, c_fresh)
+
+##############################stability_limit##############################
+
+def test_stability_limit_value():
+    """
+    This test verifies the stability limit of the explicit scheme for 
+    unit spacing, mobility and A and grad_coef = 0.5, where the largest 
+    Laplacian eigenvalue is 8 and the expected limit is 2/(8*(2 + 8)) = 0.025.
+    With zero mobility the concentration does not evolve and any step is stable.
+
+    Parameters:
+    ----------
+    None
+
+    Assertions:
+    -----------
+    - Asserts that the limit is 0.025.
+    - Asserts that the limit is infinite for zero mobility.
+    """
+    assert np.isclose(Cahn_Hilliard.stability_limit(1.0, 1.0, 1.0, 0.5, 1.0), 0.025)
+    assert Cahn_Hilliard.stability_limit(1.0, 1.0, 0.0, 0.5, 1.0) == np.inf
+
+def test_evolve_simulation_warns_above_stability_limit():
+    """
+    This test verifies that the explicit Euler engine warns when the time 
+    step is larger than 'stability_limit'.
+
+    Parameters:
+    ----------
+    None
+
+    Assertions:
+    -----------
+    - Asserts that a warning is emitted.
+    """
+    import warnings
+    
+    c = Cahn_Hilliard.add_fluctuation(10, 10, c0, dc)
+    limit = Cahn_Hilliard.stability_limit(dx, dy, mobility, grad_coef, A)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        Cahn_Hilliard.evolve_simulation(c, 1, 1, 2 * limit, mobility, 
+                                        grad_coef, A, dx, dy)
+    
+    assert len(caught) == 1
+
+###########################evolve_simulation adaptive##########################
+
+def test_evolve_simulation_adaptive_times():
+    """
+    This test verifies that with adaptive time stepping the results are 
+    stored at the same times as with the fixed time step and that the 
+    evolution stays close to the fixed step one.
+
+    Parameters:
+    ----------
+    None
+
+    Assertions:
+    -----------
+    - Asserts that the times of the results are the same.
+    - Asserts that the final concentrations differ by less than 1e-3.
+    """
+    c_initial = Cahn_Hilliard.add_fluctuation(16, 16, c0, dc)
+    results_fixed = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 1000, 300, 
+                                                    dtime, mobility, grad_coef, 
+                                                    A, dx, dy)
+    results_adaptive = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 1000, 300, 
+                                                       dtime, mobility, grad_coef, 
+                                                       A, dx, dy, adaptive=True, 
+                                                       tolerance=1e-5)
+    
+    assert [r[0] for r in results_fixed] == [r[0] for r in results_adaptive]
+    assert np.allclose(results_fixed[-1][1], results_adaptive[-1][1], atol=1e-3)
+
+def test_evolve_simulation_adaptive_invalid_tolerance():
+    """
+    This test verifies that the adaptive time stepping refuses 
+    a tolerance that is not positive.
+
+    Parameters:
+    ----------
+    None
+
+    Assertions:
+    -----------
+    - Asserts that a ValueError is raised for a zero tolerance.
+    """
+    c = Cahn_Hilliard.add_fluctuation(10, 10, c0, dc)
+    try:
+        Cahn_Hilliard.evolve_simulation(c, 10, 5, dtime, mobility, grad_coef, 
+                                        A, dx, dy, adaptive=True, tolerance=0.0)
+        raised = False
+    except ValueError:
+        raised = True
+    
+    assert raised
         
 ###############################save_results_csv############################### 
 
@@ -689,4 +1029,2085 @@ def test_load_results_from_csv():
         assert np.array_equal(orig_mu_c, loaded_mu_c)
 
     # Clean up
-    os.remove(filename)
\ No newline at end of file
+    os.remove(filename)
+
+###############################save_results_npy###############################
+
+def test_save_results_npy():
+    """
+    This function generates mock simulation results, saves them in the 
+    binary format with chunks smaller than the number of frames and 
+    loads them back, checking that the data and the metadata are preserved.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the results are split into the expected number of chunks.
+    - Asserts that the metadata contains the grid shape and the configuration.
+    - Asserts that the loaded results are the same as the original ones.
+    """
+    import shutil
+    
+    Nx, Ny = 10, 8
+    c = Cahn_Hilliard.add_fluctuation(Nx, Ny, c0, dc)
+    original_results = Cahn_Hilliard.evolve_simulation(c, 500, 100, dtime, 
+                                                       mobility, grad_coef, 
+                                                       A, dx, dy)
+    folder = 'test_save_results_npy'
+    Cahn_Hilliard.save_results_npy(original_results, folder, chunk_size=2, 
+                                   config={'material': {'A': str(A)}})
+    metadata = Cahn_Hilliard.read_metadata_npy(folder)
+    loaded_results = Cahn_Hilliard.load_results_npy(folder)
+    
+    assert len(metadata['chunks']) == 3
+    assert metadata['shape'] == [Ny, Nx]
+    assert metadata['config'] == {'material': {'A': str(A)}}
+    assert len(original_results) == len(loaded_results)
+    for (orig_time, 
+         orig_c, orig_mu_c), (loaded_time, 
+                              loaded_c, loaded_mu_c) in zip(original_results, 
+                                                            loaded_results):
+        assert orig_time == loaded_time
+        assert np.array_equal(orig_c, loaded_c)
+        assert np.array_equal(orig_mu_c, loaded_mu_c)
+    
+    # Clean up
+    shutil.rmtree(folder)
+
+def test_save_results_npy_invalid_chunk_size():
+    """
+    This test verifies that 'save_results_npy' refuses a chunk size 
+    lower than one.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that a ValueError is raised for a zero chunk size.
+    """
+    try:
+        Cahn_Hilliard.save_results_npy([], 'test_invalid_chunk_size', chunk_size=0)
+        raised = False
+    except ValueError:
+        raised = True
+    
+    assert raised
+
+##############################convert_csv_to_npy##############################
+
+def test_convert_csv_to_npy():
+    """
+    This function saves mock simulation results to a CSV file, converts it 
+    to the binary format and checks that the converted results are the same 
+    as the ones loaded from the CSV file.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the converted results are the same as the CSV ones.
+    """
+    import shutil
+    
+    Nx, Ny = 10, 8
+    c = Cahn_Hilliard.add_fluctuation(Nx, Ny, c0, dc)
+    original_results = Cahn_Hilliard.evolve_simulation(c, 500, 100, dtime, 
+                                                       mobility, grad_coef, 
+                                                       A, dx, dy)
+    filename = 'test_convert_results.csv'
+    folder = 'test_convert_results'
+    Cahn_Hilliard.save_results_csv(original_results, filename)
+    Cahn_Hilliard.convert_csv_to_npy(Nx, Ny, filename, folder, chunk_size=2)
+    
+    csv_results = Cahn_Hilliard.load_results_from_csv(Nx, Ny, filename)
+    npy_results = Cahn_Hilliard.load_results_npy(folder)
+    
+    assert len(csv_results) == len(npy_results)
+    for (csv_time, csv_c, csv_mu_c), (npy_time, npy_c, npy_mu_c) in zip(csv_results, 
+                                                                        npy_results):
+        assert np.isclose(csv_time, npy_time)
+        assert np.array_equal(csv_c, npy_c)
+        assert np.array_equal(csv_mu_c, npy_mu_c)
+    
+    # Clean up
+    os.remove(filename)
+    shutil.rmtree(folder)
+
+def test_csv_results_dtype():
+    """
+    This test saves float32 results to a CSV file and verifies that the 
+    readers of CSV results keep the floating point type of the simulation.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the arrays loaded, opened and converted with dtype 
+      float32 are float32 and equal to the saved ones.
+    - Asserts that the metadata of the converted results stores float32.
+    """
+    import shutil
+    
+    Nx, Ny = 6, 5
+    c = Cahn_Hilliard.add_fluctuation(Nx, Ny, c0, dc, dtype='float32')
+    original_results = Cahn_Hilliard.evolve_simulation(c, 20, 10, dtime, mobility, 
+                                                       grad_coef, A, dx, dy)
+    filename = 'test_csv_dtype.csv'
+    folder = 'test_csv_dtype'
+    Cahn_Hilliard.save_results_csv(original_results, filename)
+    Cahn_Hilliard.convert_csv_to_npy(Nx, Ny, filename, folder, dtype='float32')
+    
+    for results in (Cahn_Hilliard.load_results_from_csv(Nx, Ny, filename, dtype='float32'), 
+                    Cahn_Hilliard.open_results_csv(Nx, Ny, filename, dtype='float32'), 
+                    Cahn_Hilliard.load_results_npy(folder)):
+        for (_, c, mu_c), (_, original_c, original_mu_c) in zip(results, original_results):
+            assert c.dtype == np.float32 and mu_c.dtype == np.float32
+            assert np.array_equal(c, original_c)
+            assert np.array_equal(mu_c, original_mu_c)
+    
+    assert Cahn_Hilliard.read_metadata_npy(folder)['dtype'] == np.dtype('float32').str
+    
+    # Clean up
+    os.remove(filename)
+    shutil.rmtree(folder)
+
+##############################iterate_simulation##############################
+
+def test_iterate_simulation_matches_evolve_simulation():
+    """
+    This test verifies that the generator returned by 'iterate_simulation' 
+    does not evolve the concentration before the first result is requested, 
+    and then yields the same results as 'evolve_simulation'.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the concentration is untouched when the generator is created.
+    - Asserts that the yielded results are the same as the ones in the list.
+    """
+    c_initial = Cahn_Hilliard.add_fluctuation(10, 10, c0, dc)
+    c = c_initial.copy()
+    snapshots = Cahn_Hilliard.iterate_simulation(c, 300, 100, dtime, mobility, 
+                                                 grad_coef, A, dx, dy)
+    
+    assert np.array_equal(c, c_initial)
+    
+    results = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 300, 100, dtime, 
+                                              mobility, grad_coef, A, dx, dy)
+    for (time, c, mu_c), (expected_time, expected_c, expected_mu_c) in zip(snapshots, 
+                                                                           results):
+        assert time == expected_time
+        assert np.array_equal(c, expected_c)
+        assert np.array_equal(mu_c, expected_mu_c)
+
+###################################NpySink###################################
+
+def test_npy_sink_incremental():
+    """
+    This test writes results frame by frame with a 'NpySink' and verifies 
+    that the frames written before a flush can be read while the sink is 
+    still open, and that the files of the incomplete last chunk are shrunk 
+    to the frames actually written when the sink is closed.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that after the flush the results contain the frames written so far.
+    - Asserts that the last chunk file contains only the written frame.
+    - Asserts that all the frames are loaded back unchanged.
+    """
+    import shutil
+    
+    folder = 'test_npy_sink'
+    frames = [(float(i), np.random.rand(6, 5), np.random.rand(6, 5)) for i in range(4)]
+    with Cahn_Hilliard.NpySink(folder, chunk_size=3) as sink:
+        for time, c, mu_c in frames[:2]:
+            sink.append(time, c, mu_c)
+        sink.flush()
+        
+        assert len(Cahn_Hilliard.load_results_npy(folder)) == 2
+        
+        for time, c, mu_c in frames[2:]:
+            sink.append(time, c, mu_c)
+    
+    last_chunk = np.load(os.path.join(folder, Cahn_Hilliard.chunk_filename('c', 1)))
+    
+    assert last_chunk.shape == (1, 6, 5)
+    
+    for (time, c, mu_c), (loaded_time, 
+                          loaded_c, loaded_mu_c) in zip(frames, 
+                                                        Cahn_Hilliard.load_results_npy(folder)):
+        assert time == loaded_time
+        assert np.array_equal(c, loaded_c)
+        assert np.array_equal(mu_c, loaded_mu_c)
+    
+    # Clean up
+    shutil.rmtree(folder)
+
+###################################CsvSink###################################
+
+def test_csv_sink_matches_save_results_csv():
+    """
+    This test verifies that a 'CsvSink' fed frame by frame writes 
+    the same file as 'save_results_csv'.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the two files have the same content.
+    """
+    frames = [(float(i), np.random.rand(4, 3), np.random.rand(4, 3)) for i in range(3)]
+    Cahn_Hilliard.save_results_csv(frames, 'test_csv_reference.csv')
+    with Cahn_Hilliard.CsvSink('test_csv_sink.csv') as sink:
+        for time, c, mu_c in frames:
+            sink.append(time, c, mu_c)
+    
+    with open('test_csv_reference.csv') as reference, open('test_csv_sink.csv') as result:
+        assert reference.read() == result.read()
+    
+    # Clean up
+    os.remove('test_csv_reference.csv')
+    os.remove('test_csv_sink.csv')
+
+##############################save_checkpoint##############################
+
+def test_checkpoint_restart_identical():
+    """
+    This test interrupts an adaptive simulation after a checkpoint, 
+    saves the checkpoint to disk, loads it back and continues the run 
+    from it, verifying that the continued run gives exactly the same 
+    results as the uninterrupted one.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the checkpoint contains the step, the number of results 
+      and the configuration hash given when it was saved.
+    - Asserts that the continued results are equal to the uninterrupted ones.
+    """
+    c_initial = Cahn_Hilliard.add_fluctuation(10, 10, c0, dc)
+    results = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 400, 100, dtime, 
+                                              mobility, grad_coef, A, dx, dy, 
+                                              adaptive=True)
+    filename = 'test_checkpoint.npz'
+    produced = []
+    
+    def checkpoint(state):
+        Cahn_Hilliard.save_checkpoint(filename, state['c'], state['istep'], 
+                                      state['time'], 'hash', len(produced), 
+                                      state['dtime_next'])
+    
+    snapshots = Cahn_Hilliard.iterate_simulation(c_initial.copy(), 400, 100, dtime, 
+                                                 mobility, grad_coef, A, dx, dy, 
+                                                 adaptive=True, checkpoint=checkpoint, 
+                                                 checkpoint_every=200)
+    # Interrupt the run after the checkpoint at step 200
+    for snapshot in snapshots:
+        produced.append(snapshot)
+        if len(produced) == 3:
+            break
+    state = Cahn_Hilliard.load_checkpoint(filename)
+    
+    assert state['istep'] == 200
+    assert state['nframes'] == 2
+    assert state['config_hash'] == 'hash'
+    
+    continued = list(Cahn_Hilliard.iterate_simulation(state['c'], 400, 100, dtime, 
+                                                      mobility, grad_coef, A, dx, dy, 
+                                                      adaptive=True, 
+                                                      start_step=state['istep'], 
+                                                      start_dtime=state['dtime_next']))
+    for (time, c, mu_c), (expected_time, 
+                          expected_c, expected_mu_c) in zip(produced[:2] + continued, 
+                                                            results):
+        assert time == expected_time
+        assert np.array_equal(c, expected_c)
+        assert np.array_equal(mu_c, expected_mu_c)
+    
+    # Clean up
+    os.remove(filename)
+
+def test_npy_sink_resume():
+    """
+    This test verifies that a 'NpySink' opened with 'resume' keeps the given 
+    number of frames of the existing results, discards the later ones 
+    and appends the new frames after them.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the results contain the kept frames followed by the new ones.
+    """
+    import shutil
+    
+    folder = 'test_npy_sink_resume'
+    frames = [(float(i), np.random.rand(6, 5), np.random.rand(6, 5)) for i in range(7)]
+    Cahn_Hilliard.save_results_npy(frames[:5], folder, chunk_size=2)
+    with Cahn_Hilliard.NpySink(folder, chunk_size=2, resume=3) as sink:
+        for time, c, mu_c in frames[5:]:
+            sink.append(time, c, mu_c)
+    loaded_results = Cahn_Hilliard.load_results_npy(folder)
+    expected = frames[:3] + frames[5:]
+    
+    assert [time for time, c, mu_c in loaded_results] == [time for time, c, mu_c in expected]
+    for (time, c, mu_c), (expected_time, expected_c, expected_mu_c) in zip(loaded_results, 
+                                                                           expected):
+        assert np.array_equal(c, expected_c)
+    
+    # Clean up
+    shutil.rmtree(folder)
+
+def test_csv_sink_resume():
+    """
+    This test verifies that a 'CsvSink' opened with 'resume' keeps the given 
+    number of rows of the existing file, discards the later ones 
+    and appends the new frames after them.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the file contains the kept frames followed by the new ones.
+    """
+    filename = 'test_csv_sink_resume.csv'
+    frames = [(float(i), np.random.rand(4, 3), np.random.rand(4, 3)) for i in range(5)]
+    Cahn_Hilliard.save_results_csv(frames[:4], filename)
+    with Cahn_Hilliard.CsvSink(filename, resume=2) as sink:
+        for time, c, mu_c in frames[4:]:
+            sink.append(time, c, mu_c)
+    loaded_results = Cahn_Hilliard.load_results_from_csv(3, 4, filename)
+    expected = frames[:2] + frames[4:]
+    
+    assert [time for time, c, mu_c in loaded_results] == [time for time, c, mu_c in expected]
+    for (time, c, mu_c), (expected_time, expected_c, expected_mu_c) in zip(loaded_results, 
+                                                                           expected):
+        assert np.array_equal(c, expected_c)
+    
+    # Clean up
+    os.remove(filename)
+
+####################################sweep####################################
+
+def test_sweep_parameter_grid():
+    """
+    This test verifies that the parameter values of a sweep are parsed 
+    from lists and ranges and combined in a cartesian product.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that a list and a range are parsed to the expected values.
+    - Asserts that the grid contains every combination of the values.
+    """
+    import sweep
+    
+    assert sweep.parse_values('0.5,1.0') == ['0.5', '1.0']
+    assert sweep.parse_values('0:1:3') == ['0.0', '0.5', '1.0']
+    
+    grid = sweep.parameter_grid(config, ['A=0.5,1.0', 'settings.seed=1:2:2'])
+    
+    assert len(grid) == 4
+    assert {('material', 'a'): '1.0', ('settings', 'seed'): '2.0'} in grid
+
+def test_sweep_job_name_base_config():
+    """
+    This test verifies that the name of a job depends on the base 
+    configuration, so that a sweep restarted with a changed base 
+    configuration does not skip its jobs as done.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the name of a job does not change with the same base 
+      configuration and the same parameters.
+    - Asserts that the name of a job changes with the base configuration.
+    - Asserts that the name of a job does not depend on the output paths.
+    """
+    import sweep
+    
+    base = configparser.ConfigParser()
+    base.read('config_test.ini')
+    overrides = {('material', 'a'): '0.5'}
+    name = sweep.job_name(base, overrides)
+    
+    assert sweep.job_name(base, dict(overrides)) == name
+    
+    base.set('settings', 'nstep', str(base.getint('settings', 'nstep') + 1))
+    
+    assert sweep.job_name(base, overrides) != name
+    
+    base = configparser.ConfigParser()
+    base.read('config_test.ini')
+    base.set('output', 'path', 'elsewhere')
+    
+    assert sweep.job_name(base, overrides) == name
+
+def test_run_sweep_skips_finished_jobs():
+    """
+    This test runs a small sweep on a pool of two processes, checks the 
+    summary index and the results of each job, then runs the sweep again 
+    verifying that the finished jobs are not run a second time.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the index lists all the jobs as done.
+    - Asserts that each job has its own results.
+    - Asserts that the restarted sweep does not run the finished jobs again.
+    """
+    import shutil
+    import sweep
+    
+    base = configparser.ConfigParser()
+    base.read('config_test.ini')
+    base.set('settings', 'Nx', '8')
+    base.set('settings', 'Ny', '8')
+    base.set('settings', 'nstep', '100')
+    base.set('settings', 'nprint', '50')
+    with open('test_sweep.ini', 'w') as file:
+        base.write(file)
+    folder = 'test_sweep'
+    
+    index = sweep.run_sweep('test_sweep.ini', ['A=0.5,1.0'], folder=folder, workers=2)
+    
+    assert list(index['status']) == ['done', 'done']
+    for results in index['results']:
+        assert len(Cahn_Hilliard.load_results_npy(results)) == 2
+    
+    elapsed = list(index['elapsed'])
+    index = sweep.run_sweep('test_sweep.ini', ['A=0.5,1.0'], folder=folder, workers=2)
+    
+    assert list(index['elapsed']) == elapsed
+    
+    # Clean up
+    os.remove('test_sweep.ini')
+    shutil.rmtree(folder)
+
+###################################ensemble###################################
+
+def test_add_fluctuation_ensemble():
+    """
+    This test verifies that 'add_fluctuation' with a list of seeds returns 
+    an ensemble with a leading batch axis, where each member is the matrix 
+    obtained by a single call after numpy.random.seed with its seed.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the ensemble has shape (B, Ny, Nx).
+    - Asserts that each member is equal to the single matrix with its seed.
+    """
+    seeds = [3, 7, 11]
+    ensemble = Cahn_Hilliard.add_fluctuation(Nx, Ny, c0, dc, seeds=seeds)
+    
+    assert ensemble.shape == (len(seeds), Ny, Nx)
+    
+    for seed, member in zip(seeds, ensemble):
+        np.random.seed(seed)
+        assert np.array_equal(member, Cahn_Hilliard.add_fluctuation(Nx, Ny, c0, dc))
+
+def test_evolve_simulation_ensemble():
+    """
+    This test evolves an ensemble of three members in a single vectorized 
+    run, with both engines, and verifies that the results of each member 
+    are the same as the ones of a separate run of that member.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that 'split_ensemble' returns the results of each member.
+    - Asserts that the results of each member are close to the ones of 
+      its separate run.
+    """
+    ensemble = Cahn_Hilliard.add_fluctuation(12, 10, c0, dc, seeds=[1, 2, 3])
+    for solver in ('euler', 'spectral'):
+        results = Cahn_Hilliard.evolve_simulation(ensemble.copy(), 200, 100, dtime, 
+                                                  mobility, grad_coef, A, dx, dy, 
+                                                  solver=solver)
+        members = Cahn_Hilliard.split_ensemble(results)
+        
+        assert len(members) == 3
+        
+        for member, member_results in zip(ensemble, members):
+            expected = Cahn_Hilliard.evolve_simulation(member.copy(), 200, 100, dtime, 
+                                                       mobility, grad_coef, A, dx, dy, 
+                                                       solver=solver)
+            for (time, c, mu_c), (expected_time, 
+                                  expected_c, expected_mu_c) in zip(member_results, 
+                                                                    expected):
+                assert time == expected_time
+                assert c.shape == (10, 12)
+                assert np.allclose(c, expected_c)
+                assert np.allclose(mu_c, expected_mu_c)
+
+################################numba_stepper################################
+
+def test_numba_solver_matches_euler():
+    """
+    This test verifies that the fused engine gives the same evolution as 
+    the numpy explicit Euler engine within the tolerance documented in 
+    'numba_stepper', both for a single matrix and for an ensemble. 
+    Without numba the engine falls back to the numpy one.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the final concentrations differ by less than 1e-12 
+      relative to the largest concentration.
+    """
+    import warnings
+    
+    for c_initial in (Cahn_Hilliard.add_fluctuation(15, 12, c0, dc), 
+                      Cahn_Hilliard.add_fluctuation(15, 12, c0, dc, seeds=[1, 2])):
+        results_euler = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 1000, 500, 
+                                                        dtime, mobility, grad_coef, 
+                                                        A, dx, dy)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            results_numba = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 1000, 500, 
+                                                            dtime, mobility, grad_coef, 
+                                                            A, dx, dy, solver='numba')
+        final_euler = results_euler[-1][1]
+        
+        assert np.max(np.abs(results_numba[-1][1] - final_euler)) < 1e-12 * np.max(np.abs(final_euler))
+
+def test_numba_solver_fallback():
+    """
+    This test simulates a missing numba installation and verifies that 
+    the fused engine warns and falls back to the numpy engine.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that a warning is emitted.
+    - Asserts that the results are equal to the ones of the numpy engine.
+    """
+    import warnings
+    
+    c_initial = Cahn_Hilliard.add_fluctuation(10, 10, c0, dc)
+    installed = Cahn_Hilliard.numba
+    Cahn_Hilliard.numba = None
+    try:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            results = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 100, 50, dtime, 
+                                                      mobility, grad_coef, A, dx, dy, 
+                                                      solver='numba')
+    finally:
+        Cahn_Hilliard.numba = installed
+    expected = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 100, 50, dtime, 
+                                               mobility, grad_coef, A, dx, dy)
+    
+    assert len(caught) == 1
+    assert np.array_equal(results[-1][1], expected[-1][1])
+
+def test_numba_solver_restores_threads():
+    """
+    This test verifies that the number of threads given to the fused 
+    engine does not change the number of threads of numba in the rest 
+    of the process.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the number of threads of numba is the same before 
+      the engine is prepared, after it is prepared and after a step.
+    """
+    if Cahn_Hilliard.numba is None:
+        return
+    numba = Cahn_Hilliard.numba
+    c = Cahn_Hilliard.add_fluctuation(10, 10, c0, dc)
+    previous = numba.get_num_threads()
+    step = Cahn_Hilliard.numba_stepper(c, mobility, grad_coef, A, dx, dy, workers=1)
+    
+    assert numba.get_num_threads() == previous
+    
+    step(c, dtime)
+    
+    assert numba.get_num_threads() == previous
+
+###############################threaded_stepper###############################
+
+def test_partition_rows():
+    """
+    This test verifies that the rows of the grid are split into contiguous 
+    strips covering all the rows, and that the number of strips is not 
+    larger than the number of rows.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the strips are contiguous and cover the rows 0 to Ny.
+    - Asserts that the sizes of the strips differ at most by one.
+    - Asserts that a ValueError is raised for less than one strip.
+    """
+    for Ny, nparts in ((10, 3), (7, 7), (4, 9), (100, 1)):
+        strips = Cahn_Hilliard.partition_rows(Ny, nparts)
+        sizes = [stop - start for start, stop in strips]
+        
+        assert strips[0][0] == 0 and strips[-1][1] == Ny
+        assert all(strips[i][1] == strips[i + 1][0] for i in range(len(strips) - 1))
+        assert len(strips) == min(Ny, nparts) and max(sizes) - min(sizes) <= 1
+    
+    raised = False
+    try:
+        Cahn_Hilliard.partition_rows(10, 0)
+    except ValueError:
+        raised = True
+    assert raised
+
+def test_threads_solver_matches_euler():
+    """
+    This test verifies that the multithreaded engine gives exactly the same 
+    results as the numpy explicit Euler engine for different numbers of 
+    threads, including one strip (whose halo rows are its own rows) and 
+    strips of a single row, both for a single matrix and for an ensemble.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the concentrations and chemical potentials are equal.
+    """
+    for c_initial in (Cahn_Hilliard.add_fluctuation(15, 12, c0, dc), 
+                      Cahn_Hilliard.add_fluctuation(15, 12, c0, dc, seeds=[1, 2])):
+        results_euler = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 200, 100, 
+                                                        dtime, mobility, grad_coef, 
+                                                        A, dx, dy)
+        for workers in (1, 3, 12):
+            results_threads = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 200, 100, 
+                                                              dtime, mobility, grad_coef, 
+                                                              A, dx, dy, solver='threads', 
+                                                              workers=workers)
+            for (_, c_euler, mu_euler), (_, c_threads, mu_threads) in zip(results_euler, results_threads):
+                assert np.array_equal(c_threads, c_euler)
+                assert np.array_equal(mu_threads, mu_euler)
+
+###############################process_stepper###############################
+
+def test_processes_solver_matches_euler():
+    """
+    This test verifies that the multi-process engine with shared memory 
+    gives exactly the same results as the numpy explicit Euler engine, 
+    for one partition and for several partitions, both for a single matrix 
+    and for an ensemble.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the concentrations and chemical potentials are equal.
+    """
+    for c_initial in (Cahn_Hilliard.add_fluctuation(15, 12, c0, dc), 
+                      Cahn_Hilliard.add_fluctuation(15, 12, c0, dc, seeds=[1, 2])):
+        results_euler = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 200, 100, 
+                                                        dtime, mobility, grad_coef, 
+                                                        A, dx, dy)
+        for workers in (1, 3):
+            results_processes = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 200, 100, 
+                                                                dtime, mobility, grad_coef, 
+                                                                A, dx, dy, solver='processes', 
+                                                                workers=workers)
+            for (_, c_euler, mu_euler), (_, c_processes, mu_processes) in zip(results_euler, results_processes):
+                assert np.array_equal(c_processes, c_euler)
+                assert np.array_equal(mu_processes, mu_euler)
+
+def test_processes_solver_shared_field():
+    """
+    This test verifies that the multi-process engine evolves its shared 
+    concentration in place, and that the concentration of the caller 
+    is still updated at the end of a run whose last step is not a snapshot.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that a step on the shared concentration returns the shared 
+      chemical potential and gives the same result as a step on a copy.
+    - Asserts that the final concentration of the caller is equal to the 
+      one of the numpy engine.
+    """
+    c_initial = Cahn_Hilliard.add_fluctuation(15, 12, c0, dc)
+    step = Cahn_Hilliard.process_stepper(c_initial, mobility, grad_coef, A, dx, dy, workers=2)
+    c_copy = c_initial.copy()
+    mu_copy = step(c_copy, dtime).copy()
+    np.copyto(step.field, c_initial)
+    mu_shared = step(step.field, dtime)
+    
+    assert np.array_equal(step.field, c_copy)
+    assert np.array_equal(mu_shared, mu_copy)
+    del step
+    
+    c_euler = c_initial.copy()
+    c_processes = c_initial.copy()
+    Cahn_Hilliard.evolve_simulation(c_euler, 150, 100, dtime, mobility, grad_coef, A, dx, dy)
+    Cahn_Hilliard.evolve_simulation(c_processes, 150, 100, dtime, mobility, grad_coef, A, dx, dy, 
+                                    solver='processes', workers=2)
+    
+    assert np.array_equal(c_processes, c_euler)
+
+def test_partition_step_queue_transport():
+    """
+    This test runs the partitions of 'partition_step' on threads that only 
+    exchange messages through the local stand-in 'QueueTransport', as the 
+    nodes of a cluster would do, and verifies that they give the same 
+    evolution as the numpy explicit Euler engine.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the concentration and chemical potential are equal.
+    - Asserts that each partition sends four rows per step.
+    """
+    import threading
+    
+    nstep = 50
+    c_initial = Cahn_Hilliard.add_fluctuation(15, 12, c0, dc)
+    c_euler = c_initial.copy()
+    step = Cahn_Hilliard.euler_stepper(c_euler, mobility, grad_coef, A, dx, dy)
+    for _ in range(nstep):
+        mu_euler = step(c_euler, dtime)
+    
+    c = c_initial.copy()
+    mu_c = np.empty_like(c)
+    strips = [Cahn_Hilliard.strip_buffers(c, start, stop) 
+              for start, stop in Cahn_Hilliard.partition_rows(c.shape[0], 4)]
+    transport = Cahn_Hilliard.QueueTransport(len(strips))
+    
+    def rank_loop(rank):
+        for _ in range(nstep):
+            Cahn_Hilliard.partition_step(rank, strips[rank], c, mu_c, transport, 
+                                         mobility, grad_coef, A, dx, dy, dtime)
+    
+    threads = [threading.Thread(target=rank_loop, args=(rank,)) for rank in range(len(strips))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert np.array_equal(c, c_euler)
+    assert np.array_equal(mu_c, mu_euler)
+    assert transport.messages == 4 * len(strips) * nstep
+
+#####################################3D#####################################
+
+def test_my_laplacian_3d():
+    """
+    This test verifies the 7-point Laplacian of a 3D grid: the allocation-free 
+    version agrees with the reference one, also for each member of an ensemble 
+    and for different spacings, and the Laplacian of a sinusoidal concentration 
+    along z only is the one of the second difference along z.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the allocation-free and reference Laplacians are close.
+    - Asserts that the ensemble Laplacian is the one of each member.
+    - Asserts that the Laplacian of sin(2*pi*z/Nz) is (2*cos(2*pi/Nz) - 2)/dz^2 times it.
+    - Asserts that a ValueError is raised for a non-positive dz.
+    """
+    c = Cahn_Hilliard.add_fluctuation(9, 7, c0, dc, Nz=5)
+    reference = Cahn_Hilliard.my_laplacian(c, 1.0, 0.7, dz=1.3)
+    
+    assert c.shape == (5, 7, 9)
+    assert np.allclose(Cahn_Hilliard.my_laplacian_inplace(c, 1.0, 0.7, dz=1.3), reference)
+    
+    ensemble = Cahn_Hilliard.add_fluctuation(9, 7, c0, dc, seeds=[1, 2], Nz=5)
+    lap_ensemble = Cahn_Hilliard.my_laplacian_inplace(ensemble, 1.0, 0.7, dz=1.3)
+    for member, lap_member in zip(ensemble, lap_ensemble):
+        assert np.allclose(lap_member, Cahn_Hilliard.my_laplacian(member, 1.0, 0.7, dz=1.3))
+    
+    Nz = 8
+    wave = np.sin(2 * np.pi * np.arange(Nz) / Nz)[:, np.newaxis, np.newaxis] * np.ones((Nz, 4, 6))
+    expected = (2 * np.cos(2 * np.pi / Nz) - 2) / 0.5**2 * wave
+    assert np.allclose(Cahn_Hilliard.my_laplacian_inplace(wave, 1.0, 1.0, dz=0.5), expected)
+    
+    raised = False
+    try:
+        Cahn_Hilliard.my_laplacian_inplace(c, 1.0, 1.0, dz=0)
+    except ValueError:
+        raised = True
+    assert raised
+
+def test_laplacian_symbol_3d():
+    """
+    This test verifies that multiplying the 3D Fourier transform of a grid 
+    by 'laplacian_symbol' with 'dz' gives the same result as 'my_laplacian'.
+
+    Parameters:
+    ----------
+    None
+
+    Assertions:
+    -----------
+    - Asserts that the spectral Laplacian is close to the finite-difference one.
+    """
+    c = np.random.rand(6, 12, 9)
+    symbol = Cahn_Hilliard.laplacian_symbol(c.shape, 1.0, 1.5, 0.8)
+    result = np.fft.irfftn(np.fft.rfftn(c) * symbol, s=c.shape)
+    
+    assert np.allclose(result, Cahn_Hilliard.my_laplacian(c, 1.0, 1.5, dz=0.8))
+
+def test_evolve_simulation_3d():
+    """
+    This test evolves a 3D grid and verifies that the results have its shape, 
+    that the total concentration is conserved, that the spectral engine agrees 
+    with the explicit one for a small time step, and that the engines 
+    without 3D support are rejected.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the results have the shape of the grid.
+    - Asserts that the mean concentration does not change.
+    - Asserts that the spectral and explicit results are close.
+    - Asserts that a ValueError is raised for the 'threads' engine.
+    """
+    c_initial = Cahn_Hilliard.add_fluctuation(10, 8, c0, dc, Nz=6)
+    results = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 200, 100, dtime, mobility, 
+                                              grad_coef, A, dx, dy, dz=1.0)
+    results_spectral = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 200, 100, dtime, mobility, 
+                                                       grad_coef, A, dx, dy, dz=1.0, solver='spectral')
+    
+    for (_, c, mu_c), (_, c_spectral, _) in zip(results, results_spectral):
+        assert c.shape == (6, 8, 10) and mu_c.shape == (6, 8, 10)
+        assert np.isclose(np.mean(c), np.mean(c_initial))
+        assert np.allclose(c_spectral, c, atol=1e-4)
+    
+    raised = False
+    try:
+        Cahn_Hilliard.evolve_simulation(c_initial.copy(), 200, 100, dtime, mobility, 
+                                        grad_coef, A, dx, dy, dz=1.0, solver='threads')
+    except ValueError:
+        raised = True
+    assert raised
+
+def test_planar_slices_csv():
+    """
+    This test saves planar slices of 3D results to a CSV file and reads 
+    them back with the shape given by 'saved_frame_shape'.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the slices are the planes of the grid at the indices.
+    - Asserts that the slices read from the CSV file are the saved ones.
+    - Asserts that a ValueError is raised for an index out of the grid.
+    """
+    c = Cahn_Hilliard.add_fluctuation(10, 8, c0, dc, Nz=6)
+    slices = Cahn_Hilliard.planar_slices(c, 'y', [0, 5])
+    
+    assert np.array_equal(slices[:, 1, :], c[:, 5, :])
+    
+    filename = 'test_slices.csv'
+    Cahn_Hilliard.save_results_csv([(0.0, slices, slices)], filename=filename)
+    shape = Cahn_Hilliard.saved_frame_shape(10, 8, 6, 'y', 2)
+    loaded = Cahn_Hilliard.load_results_from_csv(shape[-1], shape[-2], filename=filename, Nz=shape[0])
+    os.remove(filename)
+    
+    assert shape == (6, 2, 10)
+    assert np.allclose(loaded[0][1], slices)
+    
+    raised = False
+    try:
+        Cahn_Hilliard.planar_slices(c, 'z', [6])
+    except ValueError:
+        raised = True
+    assert raised
+
+##################################precision##################################
+
+def test_add_fluctuation_dtype():
+    """
+    This test verifies that 'add_fluctuation' rounds the same random 
+    concentration to the requested floating point type, and rejects 
+    non floating types.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the matrix has the requested type.
+    - Asserts that it is the double precision matrix rounded to float32.
+    - Asserts that a ValueError is raised for an integer type.
+    """
+    np.random.seed(seed)
+    c_double = Cahn_Hilliard.add_fluctuation(Nx, Ny, c0, dc)
+    np.random.seed(seed)
+    c_single = Cahn_Hilliard.add_fluctuation(Nx, Ny, c0, dc, dtype='float32')
+    
+    assert c_double.dtype == np.float64 and c_single.dtype == np.float32
+    assert np.array_equal(c_single, c_double.astype(np.float32))
+    
+    raised = False
+    try:
+        Cahn_Hilliard.add_fluctuation(Nx, Ny, c0, dc, dtype=int)
+    except ValueError:
+        raised = True
+    assert raised
+
+def test_evolve_simulation_float32():
+    """
+    This test evolves a float32 concentration and verifies that the results 
+    and the saved binary results stay in single precision, close to the 
+    double precision ones and with the mass conserved within the 
+    single precision rounding.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the results and the saved results are float32.
+    - Asserts that the results are close to the float64 ones.
+    - Asserts that the mean concentration changes by less than 1e-5.
+    """
+    import shutil
+    
+    c_initial = Cahn_Hilliard.add_fluctuation(20, 15, c0, dc)
+    results_double = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 1000, 500, dtime, 
+                                                     mobility, grad_coef, A, dx, dy)
+    results_single = Cahn_Hilliard.evolve_simulation(c_initial.astype(np.float32), 1000, 500, dtime, 
+                                                     mobility, grad_coef, A, dx, dy)
+    folder = 'test_results_float32'
+    Cahn_Hilliard.save_results_npy(results_single, folder=folder)
+    loaded = Cahn_Hilliard.load_results_npy(folder)
+    shutil.rmtree(folder)
+    
+    for (_, c_double, _), (_, c_single, mu_single), (_, c_loaded, _) in zip(results_double, results_single, loaded):
+        assert c_single.dtype == np.float32 and mu_single.dtype == np.float32
+        assert c_loaded.dtype == np.float32
+        assert np.allclose(c_single, c_double, atol=1e-4)
+        assert abs(np.mean(c_single, dtype=np.float64) - np.mean(c_initial.astype(np.float32), dtype=np.float64)) < 1e-5
+
+##################################benchmark##################################
+
+def test_run_benchmarks_json():
+    """
+    This test runs the benchmarks on a small grid with a single engine and 
+    verifies that the report can be written as JSON and contains the rates.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the report is serializable to JSON.
+    - Asserts that there is a record for each kernel, the step and each input/output operation.
+    - Asserts that the rates are positive.
+    """
+    import json
+    import benchmark
+    
+    report = benchmark.run_benchmarks([16], ['euler'], ['float32'], nstep=2, repeat=1, frames=2)
+    report = json.loads(json.dumps(report))
+    records = {record['benchmark']: record for record in report['records']}
+    
+    assert set(records) == {'my_laplacian', 'my_laplacian_inplace', 'chemical_potential', 
+                            'chemical_potential_inplace', 'step', 'save_results_csv', 
+                            'load_results_from_csv', 'save_results_npy', 'load_results_npy', 
+                            'save_results_quantized', 'open_results_quantized'}
+    assert records['step']['steps_per_second'] > 0 and records['step']['seconds_per_cell_update'] > 0
+    assert records['save_results_csv']['bytes_per_second'] > 0
+    assert records['load_results_npy']['bytes'] > 0
+    assert records['save_results_quantized']['ratio'] > records['save_results_npy']['ratio']
+
+def test_run_benchmarks_without_numba():
+    """
+    This test simulates a missing numba installation and verifies that the 
+    benchmarks do not report the fallback of the 'numba' engine as numba.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that there is a step record for 'euler' and none for 'numba'.
+    """
+    import benchmark
+    
+    installed = Cahn_Hilliard.numba
+    Cahn_Hilliard.numba = None
+    try:
+        report = benchmark.run_benchmarks([8], ['euler', 'numba'], ['float64'], 
+                                          nstep=1, repeat=1, frames=1)
+    finally:
+        Cahn_Hilliard.numba = installed
+    engines = [record['engine'] for record in report['records'] if record['benchmark'] == 'step']
+    
+    assert engines == ['euler']
+
+##################################Profiler##################################
+
+def test_profiler_phases():
+    """
+    This test evolves a concentration with and without a profiler, then saves 
+    and loads the results with it, and verifies the recorded phases and counters.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the results do not depend on the profiler.
+    - Asserts that the phases of the 'euler' step and of the input/output are recorded.
+    - Asserts that the steps, snapshots and bytes are counted.
+    - Asserts that the summary lists the phases.
+    """
+    import shutil
+    
+    c_initial = Cahn_Hilliard.add_fluctuation(Nx, Ny, c0, dc)
+    profiler = Cahn_Hilliard.Profiler()
+    results = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 100, 50, dtime, mobility, 
+                                              grad_coef, A, dx, dy)
+    profiled = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 100, 50, dtime, mobility, 
+                                               grad_coef, A, dx, dy, profiler=profiler)
+    folder = 'test_results_profiler'
+    Cahn_Hilliard.save_results_npy(profiled, folder=folder, profiler=profiler)
+    Cahn_Hilliard.load_results_npy(folder, profiler=profiler)
+    shutil.rmtree(folder)
+    
+    for (_, c, mu_c), (_, c_profiled, mu_profiled) in zip(results, profiled):
+        assert np.array_equal(c, c_profiled) and np.array_equal(mu_c, mu_profiled)
+    report = profiler.report()
+    assert report['phases']['step']['calls'] == 100
+    assert report['phases']['laplacian']['calls'] == 200
+    assert {'chemical_potential', 'diffusion_potential', 'update', 
+            'snapshot', 'output', 'input'} <= set(report['phases'])
+    assert report['counters']['steps'] == 100
+    assert report['counters']['snapshots'] == 2
+    assert report['counters']['bytes_written'] == report['counters']['bytes_read'] == 4 * c_initial.nbytes
+    assert 'laplacian' in profiler.summary()
+
+def test_evolve_simulation_callback():
+    """
+    This test verifies that the callback is called every 'callback_every' steps 
+    with the current state, and that an invalid interval is rejected.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the callback receives the steps multiple of 'callback_every'.
+    - Asserts that the state at a printing step equals the saved result.
+    - Asserts that ValueError is raised if 'callback_every' is not positive.
+    """
+    states = []
+    
+    def callback(state):
+        states.append((state['istep'], state['time'], state['c'].copy()))
+    
+    c = Cahn_Hilliard.add_fluctuation(Nx, Ny, c0, dc)
+    results = Cahn_Hilliard.evolve_simulation(c, 100, 50, dtime, mobility, grad_coef, A, dx, dy, 
+                                              callback=callback, callback_every=25)
+    
+    assert [istep for istep, _, _ in states] == [25, 50, 75, 100]
+    assert states[1][1] == results[0][0]
+    assert np.array_equal(states[1][2], results[0][1])
+    
+    raised = False
+    try:
+        Cahn_Hilliard.evolve_simulation(c, 100, 50, dtime, mobility, grad_coef, A, dx, dy, 
+                                        callback=callback, callback_every=0)
+    except ValueError:
+        raised = True
+    assert raised
+
+################################LazyResults################################
+
+def test_open_results_lazy():
+    """
+    This test saves results in the binary and CSV formats, opens them lazily 
+    and verifies length, indexing, slicing and time lookup against the 
+    results loaded in memory.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that both lazy results have the length and frames of the saved ones.
+    - Asserts that negative indices and slices select the expected frames.
+    - Asserts that 'at_time' returns the frame closest to the given time.
+    - Asserts that an index out of range raises IndexError.
+    """
+    import shutil
+    
+    results = [(0.5 * i, np.random.rand(3, 4), np.random.rand(3, 4)) for i in range(7)]
+    folder = 'test_results_lazy'
+    filename = 'test_results_lazy.csv'
+    Cahn_Hilliard.save_results_npy(results, folder=folder, chunk_size=3)
+    Cahn_Hilliard.save_results_csv(results, filename)
+    
+    for lazy in (Cahn_Hilliard.open_results_npy(folder), 
+                 Cahn_Hilliard.open_results_csv(4, 3, filename)):
+        assert len(lazy) == 7
+        for (time, c, mu_c), (time_lazy, c_lazy, mu_lazy) in zip(results, lazy):
+            assert time == time_lazy
+            assert np.allclose(c, c_lazy) and np.allclose(mu_c, mu_lazy)
+        assert np.allclose(lazy[-1][1], results[-1][1])
+        every_other = lazy[::2]
+        assert len(every_other) == 4
+        assert list(every_other.times) == [0.0, 1.0, 2.0, 3.0]
+        assert np.allclose(every_other[1][1], results[2][1])
+        assert lazy.at_time(1.1)[0] == 1.0
+        assert every_other.at_time(1.6)[0] == 2.0
+        raised = False
+        try:
+            lazy[7]
+        except IndexError:
+            raised = True
+        assert raised
+    
+    # Clean up
+    shutil.rmtree(folder)
+    os.remove(filename)
+
+##################################plotting##################################
+
+def test_selected_frames():
+    """
+    This test verifies that the plotted frames are selected by their index.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that every nsave-th frame is selected, counting from 1.
+    - Asserts that ValueError is raised if nsave is less than 1.
+    """
+    import plotting
+    
+    assert list(plotting.selected_frames(25, 10)) == [9, 19]
+    assert list(plotting.selected_frames(3, 1)) == [0, 1, 2]
+    
+    raised = False
+    try:
+        plotting.selected_frames(3, 0)
+    except ValueError:
+        raised = True
+    assert raised
+
+def test_render_frames_headless():
+    """
+    This test renders binary results without a display, as PNG files on a 
+    pool of two processes and as an animated GIF.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that a PNG file is written for each selected frame, in order.
+    - Asserts that the animation file is written.
+    """
+    import shutil
+    import plotting
+    
+    results = [(1.0 * (i + 1), np.random.rand(8, 8), np.random.rand(8, 8)) for i in range(6)]
+    folder = 'test_results_render'
+    images = 'test_images_render'
+    Cahn_Hilliard.save_results_npy(results, folder=folder)
+    
+    filenames = plotting.render_frames(('npy', folder, (8, 8)), 2, folder=images, workers=2)
+    
+    assert [os.path.basename(filename) for filename in filenames] == [
+        'plot_at_time_2.00.png', 'plot_at_time_4.00.png', 'plot_at_time_6.00.png']
+    assert all(os.path.exists(filename) for filename in filenames)
+    
+    plotting.write_animation(Cahn_Hilliard.open_results_npy(folder), 'test_render.gif')
+    
+    assert os.path.getsize('test_render.gif') > 0
+    
+    # Clean up
+    shutil.rmtree(folder)
+    shutil.rmtree(images)
+    os.remove('test_render.gif')
+
+##############################structure_factor##############################
+
+def test_structure_factor_single_mode():
+    """
+    This test computes the structure factor of a concentration modulated 
+    by a single cosine wave, whose power is all in one shell.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the peak of S(k) is in the shell of the wave number of 
+      the modulation, and that the other shells are empty.
+    - Asserts that the sum of S(k) over the wave vectors is the variance 
+      of the concentration times the number of points (Parseval).
+    - Asserts that the characteristic length is close to the wavelength.
+    - Asserts that a uniform concentration has an infinite length.
+    """
+    N, m, spacing = 32, 4, 0.5
+    rows = np.arange(N)[:, np.newaxis] * np.ones((1, N))
+    c = c0 + 0.1 * np.cos(2 * np.pi * m * rows / N)
+    k, S = Cahn_Hilliard.structure_factor(c, spacing, spacing)
+    k0 = 2 * np.pi * m / (N * spacing)
+    peak = np.argmax(S)
+    dk = 2 * np.pi / (N * spacing)
+    
+    assert abs(k[peak] - k0) < dk / 2
+    assert np.allclose(np.delete(S, peak), 0, atol=1e-20)
+    
+    shells, weights, nshells, _ = Cahn_Hilliard.structure_factor_shells(c.shape, spacing, spacing)
+    counts = np.bincount(shells.ravel(), weights=weights.ravel(), minlength=nshells)
+    
+    assert np.isclose(S[peak] * counts[np.rint(k0 / dk).astype(int)], np.var(c) * N * N)
+    assert np.isclose(Cahn_Hilliard.characteristic_length(k, S), N * spacing / m, rtol=0.05)
+    assert Cahn_Hilliard.characteristic_length(*Cahn_Hilliard.structure_factor(np.full((8, 8), c0), 1.0, 1.0)) == np.inf
+
+def test_structure_factor_analysis_callback():
+    """
+    This test runs the in-situ analysis as the callback of a simulation, 
+    saves its curves, and continues it from the saved file.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that a curve is computed at every call, with the steps and times.
+    - Asserts that the curves are equal to the ones of 'structure_factor' 
+      on the saved snapshots.
+    - Asserts that the saved file is read back with the same curves.
+    - Asserts that an analysis resumed at a time keeps only the earlier curves.
+    """
+    filename = 'test_structure_factor.npz'
+    c = Cahn_Hilliard.add_fluctuation(16, 12, c0, dc)
+    analysis = Cahn_Hilliard.StructureFactorAnalysis(dx, dy, filename=filename)
+    results = Cahn_Hilliard.evolve_simulation(c, 400, 200, dtime, mobility, grad_coef, A, 
+                                              dx, dy, callback=analysis, callback_every=100)
+    analysis.save()
+    data = Cahn_Hilliard.load_structure_factor(filename)
+    
+    assert list(data['steps']) == [100, 200, 300, 400]
+    assert np.allclose(data['times'], [1.0, 2.0, 3.0, 4.0])
+    assert data['structure_factor'].shape == (4, len(data['k']))
+    for row, (time, c_saved, _) in zip((1, 3), results):
+        k, S = Cahn_Hilliard.structure_factor(c_saved, dx, dy)
+        
+        assert np.array_equal(data['k'], k)
+        assert np.allclose(data['structure_factor'][row], S)
+        assert np.isclose(data['lengths'][row], Cahn_Hilliard.characteristic_length(k, S))
+    
+    resumed = Cahn_Hilliard.StructureFactorAnalysis(dx, dy, filename=filename, resume=2.0)
+    
+    assert resumed.steps == [100, 200]
+    assert np.allclose(resumed.curves, data['structure_factor'][:2])
+    
+    # Clean up
+    os.remove(filename)
+
+#################################convergence#################################
+
+def test_free_energy_variation():
+    """
+    This test verifies that the variation of the discrete free energy with 
+    respect to the concentration at one point is the generalized diffusion 
+    potential of the time step, mu_c - 2*K*laplacian(c).
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the finite difference derivative of the total free 
+      energy matches the diffusion potential, in 2D and in 3D.
+    - Asserts that an ensemble gives the free energy of each member.
+    """
+    for c, dz in ((Cahn_Hilliard.add_fluctuation(7, 6, c0, dc), None), 
+                  (Cahn_Hilliard.add_fluctuation(5, 4, c0, dc, Nz=3), 0.8)):
+        potential = Cahn_Hilliard.chemical_potential(c, A) - 2 * grad_coef * Cahn_Hilliard.my_laplacian(c, 0.9, 1.1, dz)
+        index = (1,) * c.ndim
+        h = 1e-6
+        shifted = [c.copy(), c.copy()]
+        shifted[0][index] += h
+        shifted[1][index] -= h
+        energies = [Cahn_Hilliard.free_energy(s, A, grad_coef, 0.9, 1.1, dz) * c.size for s in shifted]
+        
+        assert np.isclose((energies[0] - energies[1]) / (2 * h), potential[index], rtol=1e-6)
+    
+    ensemble = Cahn_Hilliard.add_fluctuation(6, 5, c0, dc, seeds=[1, 2])
+    
+    assert np.allclose(Cahn_Hilliard.free_energy(ensemble, A, grad_coef, dx, dy), 
+                       [Cahn_Hilliard.free_energy(member, A, grad_coef, dx, dy) for member in ensemble])
+
+def test_convergence_stop():
+    """
+    This test runs simulations that stop when the change of the 
+    concentration becomes slow, with a fixed and an adaptive time step, 
+    and records the stop in the metadata of binary results.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the run stops before 'nstep', with the result of the 
+      step of the stop as the last one, and the same results as the 
+      full run before it.
+    - Asserts that the stop is recorded in the metadata of the results 
+      and removed when the results are resumed.
+    - Asserts that a ValueError is raised without any criterion.
+    """
+    import shutil
+    
+    c_initial = Cahn_Hilliard.add_fluctuation(16, 16, c0, dc)
+    full = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 20000, 1000, dtime, mobility, 
+                                           grad_coef, A, dx, dy)
+    criteria = Cahn_Hilliard.ConvergenceCriteria(A, grad_coef, dx, dy, change=1e-3)
+    stopped = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 20000, 1000, dtime, mobility, 
+                                              grad_coef, A, dx, dy, stop=criteria, stop_every=300)
+    
+    assert criteria.stop['reason'] == 'change' and criteria.stop['rate'] < 1e-3
+    assert criteria.stop['step'] < 20000 and criteria.stop['step'] % 300 == 0
+    assert np.isclose(stopped[-1][0], criteria.stop['step'] * dtime)
+    for (time, c, _), (expected_time, expected_c, _) in zip(stopped[:-1], full):
+        assert time == expected_time and np.array_equal(c, expected_c)
+    
+    criteria = Cahn_Hilliard.ConvergenceCriteria(A, grad_coef, dx, dy, energy=1e-4, length=1e-5)
+    adaptive = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 20000, 1000, dtime, mobility, 
+                                               grad_coef, A, dx, dy, adaptive=True, 
+                                               stop=criteria, stop_every=20)
+    
+    assert criteria.stop is not None and adaptive[-1][0] == criteria.stop['time'] < 200.0
+    
+    folder = 'test_convergence_results'
+    with Cahn_Hilliard.NpySink(folder) as sink:
+        for time, c, mu_c in adaptive:
+            sink.append(time, c, mu_c)
+        sink.record_stop(criteria.stop)
+    
+    assert Cahn_Hilliard.read_metadata_npy(folder)['stop'] == criteria.stop
+    
+    with Cahn_Hilliard.NpySink(folder, resume=1):
+        pass
+    
+    assert 'stop' not in Cahn_Hilliard.read_metadata_npy(folder)
+    
+    raised = False
+    try:
+        Cahn_Hilliard.ConvergenceCriteria(A, grad_coef, dx, dy)
+    except ValueError:
+        raised = True
+    assert raised
+    
+    # Clean up
+    shutil.rmtree(folder)
+
+################################QuantizedSink################################
+
+def test_quantized_results_error_bound():
+    """
+    This test saves the results of a simulation in the compressed format 
+    and reads them back, in order and in any order.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the stored concentration is within the precision of 
+      the computed one, with the same shape and type.
+    - Asserts that the chemical potential is the one of the stored 
+      concentration.
+    - Asserts that the frames read in reverse order are equal to the 
+      ones read in order.
+    - Asserts that the files are smaller than the float arrays, as 
+      reported by the sink.
+    - Asserts that a ValueError is raised for a precision that is not positive.
+    """
+    import shutil
+    
+    folder = 'test_quantized_results'
+    c = Cahn_Hilliard.add_fluctuation(20, 16, c0, dc, dtype='float32')
+    results = Cahn_Hilliard.evolve_simulation(c, 2000, 100, dtime, mobility, grad_coef, A, dx, dy)
+    precision = 1e-4
+    report = Cahn_Hilliard.save_results_quantized(results, folder, precision=precision, A=A, chunk_size=6)
+    stored = Cahn_Hilliard.open_results_quantized(folder)
+    
+    assert len(stored) == len(results)
+    for (time, c, mu_c), (expected_time, expected_c, _) in zip(stored, results):
+        assert time == expected_time
+        assert c.shape == expected_c.shape and c.dtype == np.float32
+        assert np.max(np.abs(c - expected_c)) <= precision * (1 + 1e-3)
+        assert np.array_equal(mu_c, Cahn_Hilliard.chemical_potential(c, A))
+    
+    for index in reversed(range(len(results))):
+        assert np.array_equal(stored[index][1], list(stored)[index][1])
+    
+    stored_bytes = sum(os.path.getsize(os.path.join(folder, name)) 
+                       for name in os.listdir(folder) if name.endswith('.zq'))
+    
+    assert report['frames'] == len(results) and report['stored_bytes'] == stored_bytes
+    assert report['ratio'] == report['raw_bytes'] / stored_bytes > 2
+    
+    raised = False
+    try:
+        Cahn_Hilliard.QuantizedSink(folder, precision=0)
+    except ValueError:
+        raised = True
+    assert raised
+    
+    # Clean up
+    shutil.rmtree(folder)
+
+def test_quantized_sink_resume():
+    """
+    This test verifies that a 'QuantizedSink' opened with 'resume' keeps 
+    the given number of frames, in the middle of a chunk, and continues 
+    the differences between frames from the last kept one.
+    
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the resumed results are equal to the ones written at once.
+    """
+    import shutil
+    
+    folder = 'test_quantized_resume'
+    c = Cahn_Hilliard.add_fluctuation(12, 10, c0, dc)
+    results = Cahn_Hilliard.evolve_simulation(c, 1000, 100, dtime, mobility, grad_coef, A, dx, dy)
+    Cahn_Hilliard.save_results_quantized(results, folder, A=A, chunk_size=4)
+    expected = list(Cahn_Hilliard.open_results_quantized(folder))
+    Cahn_Hilliard.save_results_quantized(results[:7] + results[:3], folder, A=A, chunk_size=4)
+    
+    with Cahn_Hilliard.QuantizedSink(folder, A=A, chunk_size=4, resume=6) as sink:
+        for time, c, mu_c in results[6:]:
+            sink.append(time, c, mu_c)
+    resumed = list(Cahn_Hilliard.open_results_quantized(folder))
+    
+    assert len(resumed) == len(expected)
+    for (time, c, mu_c), (expected_time, expected_c, expected_mu_c) in zip(resumed, expected):
+        assert time == expected_time
+        assert np.array_equal(c, expected_c)
+    
+    # Clean up
+    shutil.rmtree(folder)
+
+
+#################################multigrid#################################
+
+def test_solve_helmholtz_matches_fft():
+    """
+    This test solves (1 - a*laplacian) u = f on a periodic grid with the 
+    multigrid solver and compares it with the exact solution of the same 
+    discrete system computed with the FFT, for a grid whose sides are 
+    coarsened down to an odd size and for an ensemble.
+
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the multigrid solution equals the FFT solution.
+    - Asserts that the ensemble members are solved independently.
+    """
+    for shape in ((48, 40), (3, 32, 32)):
+        f = np.random.rand(*shape)
+        u = Cahn_Hilliard.solve_helmholtz(f, 4.0, dx, dy)
+        symbol = Cahn_Hilliard.laplacian_symbol(shape[-2:], dx, dy)
+        exact = np.fft.irfft2(np.fft.rfft2(f) / (1 - 4.0 * symbol), s=shape[-2:])
+        assert np.allclose(u, exact, atol=1e-7)
+
+def test_multigrid_solver_matches_euler():
+    """
+    This test verifies that for a small time step the multigrid engine 
+    follows the evolution of the explicit Euler one, within the error 
+    of the stabilizing splitting.
+
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the two engines return the results at the same times.
+    - Asserts that the final concentrations differ by less than a tenth 
+      of the amplitude of the Euler fluctuations.
+    """
+    c_initial = Cahn_Hilliard.add_fluctuation(32, 32, c0, dc)
+    results_euler = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 200, 100, 
+                                                    dtime, mobility, grad_coef, 
+                                                    A, dx, dy)
+    results_multigrid = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 200, 100, 
+                                                        dtime, mobility, grad_coef, 
+                                                        A, dx, dy, solver='multigrid')
+    amplitude = np.abs(results_euler[-1][1] - c0).max()
+
+    assert [r[0] for r in results_euler] == [r[0] for r in results_multigrid]
+    assert np.abs(results_euler[-1][1] - results_multigrid[-1][1]).max() < 0.1 * amplitude
+
+def test_multigrid_solver_large_time_step():
+    """
+    This test runs the multigrid engine with a time step 100 times the 
+    stability limit of the explicit scheme, with periodic and zero flux 
+    boundaries, and checks that an unknown boundary or a boundary not 
+    supported by the engine is rejected.
+
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the concentration stays finite and the mean concentration 
+      is conserved for both boundaries.
+    - Asserts that the free energy does not increase with periodic boundaries.
+    - Asserts that a ValueError is raised for an unknown boundary and for 
+      'neumann' with the 'euler' engine.
+    """
+    limit = Cahn_Hilliard.stability_limit(dx, dy, mobility, grad_coef, A)
+    for boundary in Cahn_Hilliard.BOUNDARIES:
+        c_initial = Cahn_Hilliard.add_fluctuation(32, 32, c0, dc)
+        results = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 60, 10, 100 * limit, 
+                                                  mobility, grad_coef, A, dx, dy, 
+                                                  solver='multigrid', boundary=boundary)
+        final_concentration = results[-1][1]
+        
+        assert np.all(np.isfinite(final_concentration))
+        assert np.isclose(final_concentration.mean(), c_initial.mean(), atol=1e-8)
+        if boundary == 'periodic':
+            energy = [Cahn_Hilliard.free_energy(c, A, grad_coef, dx, dy) for _, c, _ in results]
+            assert np.all(np.diff(energy) <= 1e-12)
+
+    for solver, boundary in (('multigrid', 'dirichlet'), ('euler', 'neumann')):
+        raised = False
+        try:
+            Cahn_Hilliard.evolve_simulation(c_initial.copy(), 10, 10, dtime, mobility, grad_coef, 
+                                            A, dx, dy, solver=solver, boundary=boundary)
+        except ValueError:
+            raised = True
+        assert raised
+
+
+####################################ETD####################################
+
+def test_etd_solvers_order():
+    """
+    This test runs the exponential time differencing engines with two time 
+    steps up to the same time and compares them with a run of 'etdrk4' 
+    with a much smaller step, and checks the cache of their coefficients.
+
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that halving the time step divides the error of 'etd1' 
+      by about 2, of 'etdrk2' by about 4 and of 'etdrk4' by more than 8.
+    - Asserts that a run with a fixed time step computes the coefficients once.
+    - Asserts that the mean concentration is conserved.
+    """
+    c_initial = Cahn_Hilliard.add_fluctuation(32, 32, c0, dc)
+    reference = c_initial.copy()
+    Cahn_Hilliard.evolve_simulation(reference, 200, 200, 0.01, mobility, grad_coef, 
+                                    A, dx, dy, solver='etdrk4')
+    for solver, ratio in (('etd1', 1.7), ('etdrk2', 3.4), ('etdrk4', 8.0)):
+        errors = []
+        for dtime_etd in (0.2, 0.1):
+            Cahn_Hilliard.etd_coefficients.cache_clear()
+            c = c_initial.copy()
+            Cahn_Hilliard.evolve_simulation(c, int(round(2 / dtime_etd)), 10, dtime_etd, mobility, 
+                                            grad_coef, A, dx, dy, solver=solver)
+            assert Cahn_Hilliard.etd_coefficients.cache_info().misses == 1
+            assert np.isclose(c.mean(), c_initial.mean())
+            errors.append(np.abs(c - reference).max())
+        assert errors[0] / errors[1] > ratio
+
+def test_etd_solver_3d_and_errors():
+    """
+    This test runs the 'etdrk2' engine on a 3D grid and verifies that an 
+    unknown scheme and the 'neumann' boundary are rejected.
+
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that for a small time step the 3D run follows the 'euler' one.
+    - Asserts that a ValueError is raised for an unknown scheme and for 
+      the 'neumann' boundary.
+    """
+    c_initial = Cahn_Hilliard.add_fluctuation(8, 8, c0, dc, Nz=8)
+    c_euler = c_initial.copy()
+    c_etd = c_initial.copy()
+    Cahn_Hilliard.evolve_simulation(c_euler, 100, 100, dtime, mobility, grad_coef, A, dx, dy, dz=1.0)
+    Cahn_Hilliard.evolve_simulation(c_etd, 100, 100, dtime, mobility, grad_coef, A, dx, dy, dz=1.0, 
+                                    solver='etdrk2')
+    assert np.allclose(c_euler, c_etd, atol=1e-4)
+
+    raised = False
+    try:
+        Cahn_Hilliard.etd_stepper(c_initial, mobility, grad_coef, A, dx, dy, scheme='etdrk3')
+    except ValueError:
+        raised = True
+    assert raised
+
+    raised = False
+    try:
+        Cahn_Hilliard.evolve_simulation(c_initial[0], 10, 10, dtime, mobility, grad_coef, A, dx, dy, 
+                                        solver='etd1', boundary='neumann')
+    except ValueError:
+        raised = True
+    assert raised
+
+def test_work_precision_report():
+    """
+    This test runs the work-precision comparison on the test configuration 
+    for a short time.
+
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that 'euler' is only run below its stability limit.
+    - Asserts that at the same time step 'etdrk4' is more accurate than 
+      'spectral' and 'etd1'.
+    """
+    import work_precision
+
+    report = work_precision.work_precision('config_test.ini', end_time=1.0, 
+                                           engines=('euler', 'spectral', 'etd1', 'etdrk4'), 
+                                           dtimes=(0.02, 0.1))
+    errors = report.set_index(['engine', 'dtime'])['max_abs_error']
+
+    assert list(report[report.engine == 'euler'].dtime) == [0.02]
+    assert errors['etdrk4', 0.1] < errors['spectral', 0.1]
+    assert errors['etdrk4', 0.1] < errors['etd1', 0.1]
+
+
+#################################AsyncWriter#################################
+
+def test_async_writer_npy():
+    """
+    This test writes results through an 'AsyncWriter' wrapping a 'NpySink', 
+    reusing the same arrays for every frame as the time loop does, and 
+    verifies the back-pressure metrics.
+
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the frames written before a flush are readable.
+    - Asserts that all the frames are written unchanged and in order, 
+      although the appended arrays are overwritten after each append.
+    - Asserts that the metrics count every frame and never exceed the depth.
+    """
+    import shutil
+    
+    folder = 'test_async_writer'
+    frames = [(float(i), np.random.rand(6, 5), np.random.rand(6, 5)) for i in range(7)]
+    c = np.empty((6, 5))
+    mu_c = np.empty((6, 5))
+    with Cahn_Hilliard.AsyncWriter(Cahn_Hilliard.NpySink(folder, chunk_size=3), depth=2) as writer:
+        for i, (time, c_frame, mu_frame) in enumerate(frames):
+            c[...] = c_frame
+            mu_c[...] = mu_frame
+            writer.append(time, c, mu_c)
+            if i == 3:
+                writer.flush()
+                
+                assert len(writer) == 4
+                assert len(Cahn_Hilliard.load_results_npy(folder)) == 4
+    metrics = writer.backpressure()
+    
+    for (time, c_frame, mu_frame), (loaded_time, 
+                                    loaded_c, loaded_mu_c) in zip(frames, 
+                                                                  Cahn_Hilliard.load_results_npy(folder)):
+        assert time == loaded_time
+        assert np.array_equal(c_frame, loaded_c)
+        assert np.array_equal(mu_frame, loaded_mu_c)
+    assert metrics['frames'] == 7
+    assert metrics['max_depth'] <= 2
+    
+    # Clean up
+    shutil.rmtree(folder)
+
+def test_async_writer_backpressure_and_error():
+    """
+    This test feeds an 'AsyncWriter' faster than a slow sink writes, 
+    then with a sink that fails, and verifies that the time loop only 
+    waits when the queue is full and that the error reaches the caller.
+
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the appends of the frames fitting in the queue do not wait.
+    - Asserts that the later appends wait and that the waits are reported.
+    - Asserts that all the frames are written when the writer is closed 
+      by an exception of the caller.
+    - Asserts that an error of the sink is raised by 'close' and that the 
+      sink is closed.
+    """
+    import time
+
+    class SlowSink:
+        def __init__(self):
+            self.times = []
+            self.closed = False
+        def __len__(self):
+            return len(self.times)
+        def append(self, time_frame, c, mu_c):
+            time.sleep(0.05)
+            self.times.append(time_frame)
+        def flush(self):
+            pass
+        def close(self):
+            self.closed = True
+
+    class FailingSink(SlowSink):
+        def append(self, time_frame, c, mu_c):
+            raise OSError('No space left on device')
+
+    sink = SlowSink()
+    c = np.zeros((4, 4))
+    raised = False
+    try:
+        with Cahn_Hilliard.AsyncWriter(sink, depth=3) as writer:
+            start = time.perf_counter()
+            for i in range(3):
+                writer.append(float(i), c, c)
+            
+            assert time.perf_counter() - start < 0.05
+            
+            for i in range(3, 8):
+                writer.append(float(i), c, c)
+            raise RuntimeError('error of the time loop')
+    except RuntimeError:
+        raised = True
+    metrics = writer.backpressure()
+    
+    assert raised
+    assert sink.times == [float(i) for i in range(8)] and sink.closed
+    assert metrics['blocked_count'] > 0 and metrics['blocked_seconds'] > 0
+    
+    sink = FailingSink()
+    writer = Cahn_Hilliard.AsyncWriter(sink, depth=2)
+    raised = False
+    try:
+        for i in range(5):
+            writer.append(float(i), c, c)
+        writer.close()
+    except OSError:
+        raised = True
+    writer.close()
+    
+    assert raised and sink.closed
+
+
+#################################ResultCache#################################
+
+def test_result_cache_lru():
+    """
+    This test stores the outputs of three runs in a 'ResultCache' that can 
+    hold only two of them, after using the first one again.
+
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that a stored entry returns its information and state, 
+      and that its outputs are copied back unchanged.
+    - Asserts that the least recently used entry is evicted and that 
+      the cache stays within its size limit.
+    - Asserts that the index is read back by a new cache.
+    """
+    import shutil
+    
+    folder = 'test_result_cache'
+    output = 'test_result_cache_output.npy'
+    c = np.random.rand(32, 32)
+    np.save(output, c)
+    cache = Cahn_Hilliard.ResultCache(folder)
+    for key in ('a', 'b'):
+        cache.store(key, [output], c, 10, 0.1, 'hash', 1, {'nstep': 10})
+    # Room for two entries
+    size = cache.size() / 2
+    cache.max_bytes = 2.5 * size
+    info = cache.lookup('a')
+    
+    assert info['nstep'] == 10
+    assert Cahn_Hilliard.load_checkpoint(info['state'])['istep'] == 10
+    
+    os.remove(output)
+    cache.restore('a', [output])
+    
+    assert np.array_equal(np.load(output), c)
+    
+    cache.store('c', [output], c, 10, 0.1, 'hash', 1, {'nstep': 10})
+    
+    assert 'a' in cache and 'b' not in cache and 'c' in cache
+    assert cache.size() <= 2.5 * size
+    assert len(Cahn_Hilliard.ResultCache(folder)) == 2
+    
+    # Clean up
+    shutil.rmtree(folder)
+    os.remove(output)
+
+def test_simulation_result_cache():
+    """
+    This test runs simulation.py twice with the same configuration and 
+    a result cache, then with a larger number of steps.
+
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the second run copies the results from the cache 
+      without running the simulation.
+    - Asserts that the longer run continued from the cached one gives 
+      the same results as an uninterrupted run.
+    """
+    import shutil
+    import simulation
+    
+    run_config = configparser.ConfigParser()
+    run_config.read('config_test.ini')
+    run_config.set('settings', 'nstep', '200')
+    run_config.set('settings', 'nprint', '50')
+    run_config.set('output', 'path', 'test_cache_results')
+    run_config.set('output', 'checkpoint', '')
+    run_config.set('cache', 'path', 'test_cache')
+    simulation.run_simulation(run_config)
+    first = Cahn_Hilliard.load_results_npy('test_cache_results')
+    shutil.rmtree('test_cache_results')
+    
+    iterate_simulation = Cahn_Hilliard.iterate_simulation
+    Cahn_Hilliard.iterate_simulation = None
+    try:
+        simulation.run_simulation(run_config)
+    finally:
+        Cahn_Hilliard.iterate_simulation = iterate_simulation
+    cached = Cahn_Hilliard.load_results_npy('test_cache_results')
+    
+    assert [r[0] for r in first] == [r[0] for r in cached]
+    assert all(np.array_equal(r[1], s[1]) for r, s in zip(first, cached))
+    
+    run_config.set('settings', 'nstep', '400')
+    simulation.run_simulation(run_config)
+    continued = Cahn_Hilliard.load_results_npy('test_cache_results')
+    run_config.set('cache', 'path', '')
+    run_config.set('output', 'path', 'test_cache_reference')
+    simulation.run_simulation(run_config)
+    reference = Cahn_Hilliard.load_results_npy('test_cache_reference')
+    
+    assert [r[0] for r in continued] == [r[0] for r in reference]
+    assert all(np.array_equal(r[1], s[1]) for r, s in zip(continued, reference))
+    
+    # Clean up
+    for folder in ('test_cache', 'test_cache_results', 'test_cache_reference'):
+        shutil.rmtree(folder)
+
+
+#################################MappedField#################################
+
+def test_mapped_field_matches_euler():
+    """
+    This test evolves the same initial concentration in memory with the 
+    'euler' engine and out of core with a 'MappedField', with tiles of 
+    one row, of a few rows not dividing the grid and of the whole grid.
+
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the initial concentration drawn tile by tile is the 
+      one of 'add_fluctuation' with the same seed.
+    - Asserts that the results are the same, bit for bit.
+    - Asserts that the results are the mapped arrays of the field.
+    """
+    import shutil
+    
+    folder = 'test_mapped_field'
+    np.random.seed(7)
+    c_initial = Cahn_Hilliard.add_fluctuation(12, 17, c0, dc)
+    results = Cahn_Hilliard.evolve_simulation(c_initial.copy(), 60, 20, dtime, mobility, 
+                                              grad_coef, A, dx, dy)
+    for tile_rows in (1, 5, 17):
+        np.random.seed(7)
+        field = Cahn_Hilliard.MappedField(folder, c_initial.shape, tile_rows=tile_rows)
+        field.fill_fluctuation(c0, dc)
+        
+        assert np.array_equal(field.c, c_initial)
+        
+        for (time, c, mu_c), (time_mapped, c_mapped, mu_mapped) in zip(
+                results, Cahn_Hilliard.iterate_out_of_core(field, 60, 20, dtime, mobility, 
+                                                           grad_coef, A, dx, dy)):
+            assert time == time_mapped
+            assert np.array_equal(c, c_mapped) and np.array_equal(mu_c, mu_mapped)
+            assert c_mapped is field.c and isinstance(c_mapped, np.memmap)
+        del field
+    
+    # Clean up
+    shutil.rmtree(folder)
+
+def test_out_of_core_simulation_restart():
+    """
+    This test runs simulation.py out of core, interrupted and continued 
+    from its checkpoint, and compares it with the run in memory.
+
+    Parameters:
+    -----------
+    None 
+    
+    Assertions:
+    -----------
+    - Asserts that the continued out-of-core run gives the same results 
+      as the uninterrupted run in memory.
+    - Asserts that an out-of-core run with the analysis is refused.
+    """
+    import shutil
+    import simulation
+    
+    run_config = configparser.ConfigParser()
+    run_config.read('config_test.ini')
+    run_config.set('settings', 'nstep', '200')
+    run_config.set('settings', 'nprint', '50')
+    run_config.set('output', 'path', 'test_out_of_core_results')
+    run_config.set('output', 'checkpoint', 'test_out_of_core_checkpoint.npy')
+    run_config.set('output', 'ncheckpoint', '100')
+    run_config.set('out_of_core', 'path', 'test_out_of_core')
+    run_config.set('out_of_core', 'tile_rows', '16')
+    simulation.run_simulation(run_config)
+    run_config.set('settings', 'nstep', '400')
+    simulation.run_simulation(run_config, restart=True)
+    continued = Cahn_Hilliard.load_results_npy('test_out_of_core_results')
+    
+    run_config.set('out_of_core', 'path', '')
+    run_config.set('output', 'path', 'test_in_core_results')
+    run_config.remove_option('output', 'checkpoint')
+    simulation.run_simulation(run_config)
+    reference = Cahn_Hilliard.load_results_npy('test_in_core_results')
+    
+    assert [r[0] for r in continued] == [r[0] for r in reference]
+    assert all(np.array_equal(r[1], s[1]) and np.array_equal(r[2], s[2]) 
+               for r, s in zip(continued, reference))
+    
+    run_config.set('out_of_core', 'path', 'test_out_of_core')
+    run_config.set('analysis', 'nanalysis', '100')
+    raised = False
+    try:
+        simulation.run_simulation(run_config)
+    except ValueError:
+        raised = True
+    
+    assert raised
+    
+    # Clean up
+    for folder in ('test_out_of_core', 'test_out_of_core_results', 'test_in_core_results'):
+        shutil.rmtree(folder)
+    for filename in ('test_out_of_core_checkpoint.npy', 'test_out_of_core_checkpoint.npy.json'):
+        os.remove(filename)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+
+Work-precision comparison of the time integration engines: from the initial
+concentration of a configuration, each engine is run up to the same time with
+several time steps, and the time of the run is reported together with the
+error of the final concentration with respect to a reference run of
+'etdrk4' with a time step four times smaller than the smallest one.
+The explicit 'euler' engine is only run below its stability limit.
+
+Usage: python3 work_precision.py config_material_1.ini --time 20
+       --engines euler spectral etd1 etdrk2 etdrk4 --output work_precision.csv
+
+"""
+import Cahn_Hilliard
+import argparse
+import configparser
+import os
+import time
+import numpy as np
+import pandas as pd
+
+# Time steps of the comparison, from the one of the configurations to 100 times it
+DTIMES = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+def initial_concentration(config):
+    """
+    This function draws the initial concentration of a configuration as
+    simulation.py does, in double precision and for a single member.
+
+    Parameters:
+    ----------
+    config : The configparser.ConfigParser of the configuration.
+
+    Returns:
+    -------
+    np.ndarray
+        The initial concentration.
+    """
+    np.random.seed(config.getint('settings', 'seed'))
+    return Cahn_Hilliard.add_fluctuation(config.getint('settings', 'Nx'),
+                                         config.getint('settings', 'Ny'),
+                                         config.getfloat('material', 'c0'),
+                                         config.getfloat('material', 'dc'),
+                                         Nz=config.getint('settings', 'Nz', fallback=0) or None)
+
+def run_engine(c_initial, engine, dtime, end_time, parameters):
+    """
+    This function runs an engine from 'c_initial' up to 'end_time'.
+
+    Parameters:
+    ----------
+    c_initial : The initial concentration, not modified.
+
+    engine : The name of the engine, see 'Cahn_Hilliard.STEPPERS'.
+
+    dtime : The time step, 'end_time' must be a multiple of it.
+
+    end_time : The time of the final concentration.
+
+    parameters : A dictionary of the arguments 'mobility', 'grad_coef', 'A',
+                 'dx', 'dy' and 'dz' of 'Cahn_Hilliard.evolve_simulation'.
+
+    Returns:
+    -------
+    tuple
+        The final concentration and the time of the run in seconds.
+
+    Raise:
+    -----
+    ValueError if 'end_time' is not a multiple of 'dtime'.
+    """
+    nstep = int(round(end_time / dtime))
+    if not np.isclose(nstep * dtime, end_time):
+        raise ValueError('The time {} is not a multiple of dtime = {}'.format(end_time, dtime))
+    c = c_initial.copy()
+    start = time.perf_counter()
+    Cahn_Hilliard.evolve_simulation(c, nstep, nstep, dtime, solver=engine, **parameters)
+    return c, time.perf_counter() - start
+
+def work_precision(config_file, end_time=20.0, engines=('euler', 'spectral', 'etd1', 'etdrk2', 'etdrk4'),
+                   dtimes=DTIMES):
+    """
+    This function compares the engines on a configuration: each engine is run 
+    with each time step (below 'Cahn_Hilliard.stability_limit' for 'euler') 
+    and its final concentration is compared with the reference one.
+
+    Parameters:
+    ----------
+    config_file : The configuration file.
+
+    end_time : The time of the compared concentrations (default is 20).
+
+    engines : The engines, see 'Cahn_Hilliard.STEPPERS'.
+
+    dtimes : The time steps, 'end_time' must be a multiple of each of them 
+             (default is DTIMES).
+
+    Returns:
+    -------
+    pandas.DataFrame
+        A row for each engine and time step with the number of steps, 
+        the time of the run in seconds and the largest and the root mean 
+        square error of the final concentration.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    dz = config.getfloat('settings', 'dz', fallback=0.0) or None
+    parameters = {'mobility': config.getfloat('material', 'mobility'),
+                  'grad_coef': config.getfloat('material', 'grad_coef'),
+                  'A': config.getfloat('material', 'A'),
+                  'dx': config.getfloat('settings', 'dx'), 
+                  'dy': config.getfloat('settings', 'dy'), 'dz': dz}
+    limit = Cahn_Hilliard.stability_limit(parameters['dx'], parameters['dy'], parameters['mobility'],
+                                          parameters['grad_coef'], parameters['A'], dz)
+    c_initial = initial_concentration(config)
+    reference, _ = run_engine(c_initial, 'etdrk4', min(dtimes) / 4, end_time, parameters)
+    rows = []
+    for engine in engines:
+        for dtime in dtimes:
+            if engine == 'euler' and dtime > limit:
+                continue
+            c, seconds = run_engine(c_initial, engine, dtime, end_time, parameters)
+            error = c - reference
+            rows.append({'config': os.path.basename(config_file), 'engine': engine, 
+                         'dtime': dtime, 'nstep': int(round(end_time / dtime)), 'seconds': seconds,
+                         'max_abs_error': np.max(np.abs(error)), 
+                         'rms_error': np.sqrt(np.mean(error**2))})
+    return pd.DataFrame(rows)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Work-precision comparison of the time integration engines.')
+    parser.add_argument('config', nargs='?', default='config_material_1.ini', help='configuration file')
+    parser.add_argument('--time', type=float, default=20.0, help='time of the compared concentrations')
+    parser.add_argument('--engines', nargs='+', default=['euler', 'spectral', 'etd1', 'etdrk2', 'etdrk4'],
+                        choices=sorted(Cahn_Hilliard.STEPPERS), help='engines of the time step')
+    parser.add_argument('--dtimes', type=float, nargs='+', default=list(DTIMES), help='time steps')
+    parser.add_argument('--output', default='work_precision.csv', help='CSV file of the report')
+    args = parser.parse_args()
+
+    report = work_precision(args.config, args.time, args.engines, args.dtimes)
+    report.to_csv(args.output, index=False)
+    print(report.to_string(index=False))
+    print("Report saved in {}".format(args.output))